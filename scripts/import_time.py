@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""Measure how long importing the adapter modules takes.
+
+Runs `python -X importtime` in a fresh interpreter for each module, prints
+the slowest imports it pulled in, and fails if the import took longer than
+--max-ms or pulled in any of the modules that must only be imported on
+first use.
+"""
+
+# Standard
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "lls_openai_client.client_adapter",
+    "lls_openai_client.async_client_adapter",
+]
+
+# Packages that must not be imported until a request actually needs them
+DEFERRED = ["openai", "llama_stack_client"]
+
+
+def measure(module):
+    # Returns the cumulative import time of `module` in microseconds and
+    # the (cumulative, name) pair of every module imported along the way
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:") :].split("|")
+        if not fields[1].strip().isdigit():
+            # the header line
+            continue
+        imports.append((int(fields[1]), fields[2].strip()))
+    total = next(cumulative for cumulative, name in imports if name == module)
+    return total, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        runs = [measure(module) for _ in range(args.runs)]
+        total_ms = statistics.median(total for total, _ in runs) / 1000
+        imports = runs[-1][1]
+        print(f"{module}: {total_ms:.1f} ms (median of {args.runs})")
+        for cumulative, name in sorted(imports, reverse=True)[: args.top]:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+        deferred = sorted(
+            {name for _, name in imports if name.lstrip().split(".")[0] in DEFERRED}
+        )
+        if deferred:
+            print(f"  imported eagerly: {', '.join(deferred)}")
+            failed = True
+        if args.max_ms is not None and total_ms > args.max_ms:
+            print(f"  over the {args.max_ms} ms limit")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,572 @@
+# The asyncio counterpart of client_adapter, which it mirrors method for
+# method; what the two share lives in planning and client_adapter, and
+# what is left differs only by the awaits
+# pylint: disable=duplicate-code
+
+# Standard
+from typing import TYPE_CHECKING
+import asyncio
+import functools
+import itertools
+
+# Local
+from .cache import ResponseCache
+from .client_adapter import (
+    _WARMUP_PROMPT,
+    _WARMUP_SAMPLING_PARAMS,
+    _chat_completion_chunk_builder,
+    _chat_completion_response,
+    _completion_choices,
+    _completion_chunk_builder,
+    _completion_response,
+    _InferenceResource,
+    _wrap_client,
+)
+from .limits import AdaptiveLimiter, AsyncAdaptiveLimiter, AsyncRateLimiter, RateLimiter
+from .models import AsyncModelCatalog
+from .planning import (
+    _BATCH_COMPLETION_ROUTE,
+    _BatchState,
+    _ChatCompletionRequest,
+    _chunked,
+    _CompletionRequest,
+    _is_not_implemented,
+    _llm_ids,
+    _MessageConverter,
+    _RequestPlan,
+)
+from .pool import AsyncLlamaStackPool
+from .tools import ToolRegistry
+
+if TYPE_CHECKING:
+    # Third Party
+    from llama_stack_client import AsyncLlamaStackClient
+    import httpx
+
+
+# create_iter sends batches of this many prompts at a time when there is
+# no max_concurrency to size them by
+_ITER_BATCH_SIZE = 32
+
+
+async def _gather_ordered(semaphore, fn, items):
+    # Like _map_ordered, results come back in the same order as `items`
+    # no matter which calls finish first
+    if semaphore is None:
+        return await asyncio.gather(*[fn(item) for item in items])
+
+    async def _bounded(item):
+        async with semaphore:
+            return await fn(item)
+
+    return await asyncio.gather(*[_bounded(item) for item in items])
+
+
+async def _map_unordered(semaphore, fn, items, max_pending=None):
+    # The async counterpart of client_adapter._map_unordered. Without a
+    # `max_pending` every call is started at once.
+    async def _run(item):
+        if semaphore is None:
+            return item, await fn(item)
+        async with semaphore:
+            return item, await fn(item)
+
+    items = iter(items)
+    pending = {
+        asyncio.ensure_future(_run(item))
+        for item in itertools.islice(items, max_pending)
+    }
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                for next_item in itertools.islice(items, 1):
+                    pending.add(asyncio.ensure_future(_run(next_item)))
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+_STREAM_DONE = object()
+
+
+async def _merge_streams(semaphore, open_streams):
+    # The async counterpart of client_adapter._merge_streams, always
+    # consuming the streams concurrently
+    items = asyncio.Queue()
+
+    async def _pump(index):
+        try:
+            if semaphore is None:
+                async for item in await open_streams[index]():
+                    await items.put((index, item, None))
+            else:
+                async with semaphore:
+                    async for item in await open_streams[index]():
+                        await items.put((index, item, None))
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            await items.put((index, _STREAM_DONE, err))
+        else:
+            await items.put((index, _STREAM_DONE, None))
+
+    tasks = [asyncio.create_task(_pump(i)) for i in range(len(open_streams))]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            index, item, err = await items.get()
+            if item is _STREAM_DONE:
+                if err is not None:
+                    raise err
+                remaining -= 1
+                continue
+            yield index, item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class _SingleFlight:
+    # The asyncio counterpart of client_adapter._SingleFlight. The call
+    # runs as its own task, shielded so a waiter being cancelled does
+    # not cancel it for everyone else.
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key, None)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+async def _coalesce(single_flight, key, fn):
+    if single_flight is None or key is None:
+        return await fn()
+    return await single_flight.do(key, fn)
+
+
+async def _detect_batch_inference(lls_client) -> bool | None:
+    # see client_adapter._detect_batch_inference
+    try:
+        routes = await lls_client.routes.list()
+        if not any(route.route == _BATCH_COMPLETION_ROUTE for route in routes):
+            return False
+
+        llms = _llm_ids(await lls_client.models.list())
+        if not llms:
+            return None
+        await lls_client.inference.batch_completion(model_id=llms[0], content_batch=[])
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        return False if _is_not_implemented(err) else None
+    return True
+
+
+class _AsyncBatchSupport(_BatchState):
+    # The asyncio counterpart of client_adapter._BatchSupport
+
+    async def enabled(self) -> bool:
+        if self._should_detect():
+            return self._detected(await _detect_batch_inference(self.lls_client))
+        return bool(self._enabled)
+
+    async def supports(self, api, model_id) -> bool:
+        return self._may_batch(api, model_id) and await self.enabled()
+
+    async def call(self, api, model_id, fn):
+        try:
+            return (await fn()).batch
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            self._failed(api, model_id, err)
+        return None
+
+
+async def _conform(request, indices, lls_results, guided_choice_retries, regenerate):
+    # see client_adapter._conform
+    guided_choice = request.guided_choice
+    if guided_choice is None or guided_choice_retries is None:
+        return lls_results
+    lls_results = dict(zip(indices, lls_results))
+    for _attempt in range(request.retries(guided_choice_retries)):
+        retry = guided_choice.nonconforming(
+            {
+                i: request.output_text(lls_result)
+                for i, lls_result in lls_results.items()
+            }
+        )
+        if not retry:
+            break
+        lls_results.update(zip(retry, await regenerate(retry)))
+    for i in indices:
+        guided_choice.check(request.output_text(lls_results[i]))
+    return [lls_results[i] for i in indices]
+
+
+class AsyncCompletions(_InferenceResource):
+    _batch_support_class = _AsyncBatchSupport
+
+    def __init__(
+        self,
+        llama_stack_client,
+        semaphore=None,
+        max_concurrency=None,
+        **kwargs,
+    ):
+        super().__init__(llama_stack_client, **kwargs)
+        self.semaphore = semaphore
+        self.max_concurrency = max_concurrency
+
+    async def batch_inference(self) -> bool:
+        return await self.batch_support.enabled()
+
+    async def _batch_complete(self, params):
+        if len(params["content_batch"]) < 2 or not await self.batch_support.supports(
+            "completion", params["model_id"]
+        ):
+            return None
+        return await self.batch_support.call(
+            "completion",
+            params["model_id"],
+            lambda: self.lls_client.inference.batch_completion(**params),
+        )
+
+    def _completer(self, request, i):
+        return request.bind(self.lls_client.inference.completion, i)
+
+    async def _complete_once(self, request, plan, i):
+        return await _coalesce(
+            self.single_flight, plan.key(i), self._completer(request, i)
+        )
+
+    async def _complete_batch_of(self, request, plan, indices):
+        # see Completions._complete_batch_of
+        lls_results = await self._batch_complete(request.batch_params(indices))
+        if lls_results is None:
+            lls_results = await _gather_ordered(
+                self.semaphore,
+                functools.partial(self._complete_once, request, plan),
+                indices,
+            )
+        return zip(indices, lls_results)
+
+    async def _conform(self, request, indices, lls_results):
+        # see Completions._conform
+        return await _conform(
+            request,
+            indices,
+            lls_results,
+            self.guided_choice_retries,
+            functools.partial(
+                _gather_ordered,
+                self.semaphore,
+                lambda i: self._completer(request, i)(),
+            ),
+        )
+
+    async def _check_model(self, model_id):
+        if self.model_catalog is not None:
+            await self.model_catalog.check(model_id)
+
+    async def create(self, *_args, **kwargs):
+        request = _CompletionRequest(kwargs)
+        await self._check_model(request.model_id)
+        if kwargs.get("stream", False):
+            return self._create_stream(request)
+
+        plan = _RequestPlan(
+            request, len(request.content_batch), self.cache, self.single_flight
+        )
+        unique_results = await self._batch_complete(request.batch_params(plan.unique))
+        if unique_results is None:
+            unique_results = await _gather_ordered(
+                self.semaphore,
+                functools.partial(self._complete_once, request, plan),
+                plan.unique,
+            )
+
+        unique_results = await self._conform(request, plan.unique, unique_results)
+        return _completion_response(request, plan, unique_results)
+
+    async def create_iter(self, *_args, **kwargs):
+        # see Completions.create_iter
+        if kwargs.get("stream", False):
+            raise ValueError("`create_iter` does not support streaming.")
+        request = _CompletionRequest(kwargs)
+        await self._check_model(request.model_id)
+        plan = _RequestPlan(
+            request, len(request.content_batch), self.cache, self.single_flight
+        )
+        for cached in plan.choices:
+            if cached is not None:
+                yield cached
+
+        async def _finished():
+            batch_size = self.max_concurrency or _ITER_BATCH_SIZE
+            if (
+                len(plan.unique) > 1
+                and batch_size > 1
+                and await self.batch_support.supports("completion", request.model_id)
+            ):
+                for indices in _chunked(plan.unique, batch_size):
+                    for item in await self._complete_batch_of(request, plan, indices):
+                        yield item
+                return
+            async for item in _map_unordered(
+                self.semaphore,
+                functools.partial(self._complete_once, request, plan),
+                plan.unique,
+                self.max_concurrency,
+            ):
+                yield item
+
+        async for unique_i, lls_result in _finished():
+            (lls_result,) = await self._conform(request, [unique_i], [lls_result])
+            for choice in _completion_choices(request, plan, unique_i, lls_result):
+                yield choice
+
+    async def _create_stream(self, request):
+        build_chunk = _completion_chunk_builder(request.model_id)
+        open_streams = request.stream_openers(self.lls_client.inference.completion)
+        async for index, lls_chunk in _merge_streams(self.semaphore, open_streams):
+            chunk = build_chunk(index, lls_chunk)
+            if chunk is not None:
+                yield chunk
+
+
+class AsyncChatCompletions(_InferenceResource):
+    _batch_support_class = _AsyncBatchSupport
+
+    def __init__(
+        self,
+        llama_stack_client,
+        semaphore=None,
+        tool_registry=None,
+        message_converter=None,
+        **kwargs,
+    ):
+        super().__init__(llama_stack_client, **kwargs)
+        self.semaphore = semaphore
+        self.tool_registry = tool_registry
+        if message_converter is None:
+            message_converter = _MessageConverter()
+        self.message_converter = message_converter
+
+    async def _batch_chat_complete(self, request, count):
+        # see ChatCompletions._batch_chat_complete
+        if count < 2 or not await self.batch_support.supports(
+            "chat_completion", request.model_id
+        ):
+            return None
+        return await self.batch_support.call(
+            "chat_completion",
+            request.model_id,
+            lambda: self.lls_client.inference.batch_chat_completion(
+                **request.batch_params(count)
+            ),
+        )
+
+    async def _chat_complete_once(self, request, plan, i):
+        return await _coalesce(
+            self.single_flight,
+            plan.key(i),
+            request.bind(self.lls_client.inference.chat_completion),
+        )
+
+    async def _conform(self, request, indices, lls_results):
+        # see Completions._conform
+        chat_complete = request.bind(self.lls_client.inference.chat_completion)
+        return await _conform(
+            request,
+            indices,
+            lls_results,
+            self.guided_choice_retries,
+            functools.partial(
+                _gather_ordered, self.semaphore, lambda _i: chat_complete()
+            ),
+        )
+
+    async def create(self, *_args, **kwargs):
+        if self.model_catalog is not None:
+            await self.model_catalog.check(kwargs.get("model", None))
+        request = _ChatCompletionRequest(
+            kwargs, self.tool_registry, self.message_converter
+        )
+        if kwargs.get("stream", False):
+            return self._create_stream(request)
+
+        plan = _RequestPlan(request, request.n, self.cache, self.single_flight)
+        unique_results = await self._batch_chat_complete(request, len(plan.unique))
+        if unique_results is None:
+            unique_results = await _gather_ordered(
+                self.semaphore,
+                functools.partial(self._chat_complete_once, request, plan),
+                plan.unique,
+            )
+        unique_results = await self._conform(request, plan.unique, unique_results)
+        return _chat_completion_response(request, plan, unique_results)
+
+    async def _create_stream(self, request):
+        build_chunk = _chat_completion_chunk_builder(request.model_id, request.n)
+        open_streams = request.stream_openers(self.lls_client.inference.chat_completion)
+        async for index, lls_chunk in _merge_streams(self.semaphore, open_streams):
+            chunk = build_chunk(index, lls_chunk)
+            if chunk is not None:
+                yield chunk
+
+
+class AsyncChat:
+    completions: AsyncChatCompletions
+
+    def __init__(self, llama_stack_client, **kwargs):
+        # kwargs are passed on to AsyncChatCompletions
+        self.lls_client = llama_stack_client
+        self.completions = AsyncChatCompletions(self.lls_client, **kwargs)
+
+
+class AsyncModels:
+    def __init__(self, llama_stack_client, model_catalog=None):
+        self.lls_client = llama_stack_client
+        if model_catalog is None:
+            model_catalog = AsyncModelCatalog(self.lls_client.models.list)
+        self.model_catalog = model_catalog
+
+    async def list(self, *_args, **_kwargs):
+        return await self.model_catalog.list()
+
+    async def retrieve(self, model, *_args, **_kwargs):
+        await self.model_catalog.check(model)
+        return next(m for m in await self.model_catalog.models() if m.id == model)
+
+
+class AsyncOpenAIClientAdapter:
+    completions: AsyncCompletions
+    chat: AsyncChat
+
+    def __init__(
+        self,
+        llama_stack_client: "AsyncLlamaStackClient | list",
+        max_concurrency: int | None = None,
+        batch_inference: bool | None = None,
+        cache: ResponseCache | None = None,
+        coalesce_requests: bool = True,
+        tool_cache_size: int = 256,
+        conversation_cache_size: int = 128,
+        guided_choice_retries: int | None = None,
+        model_cache_ttl: float | None = 60.0,
+        validate_models: bool = False,
+        adaptive_concurrency: AsyncAdaptiveLimiter | bool = False,
+        rate_limit: AsyncRateLimiter | None = None,
+    ):
+        # see OpenAIClientAdapter
+        self.limiter = None
+        if adaptive_concurrency is True:
+            self.limiter = AsyncAdaptiveLimiter()
+        elif adaptive_concurrency:
+            self.limiter = adaptive_concurrency
+        self.rate_limiter = rate_limit
+        # the sync limiters would block the event loop, and the calls
+        # they hold would be released before being awaited
+        if isinstance(self.limiter, AdaptiveLimiter):
+            raise ValueError(
+                "`adaptive_concurrency` must be an AsyncAdaptiveLimiter, not an "
+                "AdaptiveLimiter."
+            )
+        if isinstance(rate_limit, RateLimiter):
+            raise ValueError(
+                "`rate_limit` must be an AsyncRateLimiter, not a RateLimiter."
+            )
+        self.lls_client: "AsyncLlamaStackClient" = _wrap_client(
+            llama_stack_client, AsyncLlamaStackPool, self.limiter, rate_limit
+        )
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("`max_concurrency` must be at least 1.")
+        if guided_choice_retries is not None and guided_choice_retries < 0:
+            raise ValueError("`guided_choice_retries` must not be negative.")
+
+        # Without a max_concurrency every sub-request of a call is
+        # in flight at once
+        semaphore = None
+        if max_concurrency is not None:
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+        single_flight = _SingleFlight() if coalesce_requests else None
+        batch_support = _AsyncBatchSupport(self.lls_client, batch_inference)
+        catalog = AsyncModelCatalog(self.lls_client.models.list, ttl=model_cache_ttl)
+        model_catalog = catalog if validate_models else None
+
+        self.completions = AsyncCompletions(
+            self.lls_client,
+            semaphore=semaphore,
+            batch_inference=batch_support,
+            cache=cache,
+            single_flight=single_flight,
+            max_concurrency=max_concurrency,
+            guided_choice_retries=guided_choice_retries,
+            model_catalog=model_catalog,
+        )
+        self.chat = AsyncChat(
+            self.lls_client,
+            semaphore=semaphore,
+            batch_inference=batch_support,
+            cache=cache,
+            single_flight=single_flight,
+            tool_registry=ToolRegistry(max_entries=tool_cache_size),
+            message_converter=_MessageConverter(conversation_cache_size),
+            guided_choice_retries=guided_choice_retries,
+            model_catalog=model_catalog,
+        )
+        self.models = AsyncModels(self.lls_client, catalog)
+
+    async def warmup(self, models=None, probe: bool = False):
+        # see OpenAIClientAdapter.warmup. The catalog shares a single
+        # fetch between concurrent callers, so the extra connections are
+        # opened with plain model list calls.
+        await asyncio.gather(
+            *[self.lls_client.models.list() for _ in range(self.max_concurrency or 1)]
+        )
+        catalog = self.models.model_catalog
+        await catalog.refresh()
+        for model_id in models or []:
+            await catalog.check(model_id)
+        await self.completions.batch_support.enabled()
+
+        if probe:
+            if models is None:
+                models = _llm_ids(await self.lls_client.models.list())
+            await _gather_ordered(
+                self.completions.semaphore,
+                lambda model_id: self.lls_client.inference.completion(
+                    model_id=model_id,
+                    content=_WARMUP_PROMPT,
+                    sampling_params=_WARMUP_SAMPLING_PARAMS,
+                ),
+                models,
+            )
+
+    @property
+    def max_concurrency(self) -> int | None:
+        return self.completions.max_concurrency
+
+    @property
+    def tools(self) -> ToolRegistry:
+        return self.chat.completions.tool_registry
+
+    def register_tools(self, tools) -> str:
+        return self.tools.register(tools)
+
+    def unregister_tools(self, handle: str):
+        self.tools.unregister(handle)
+
+    async def server_supports_batched(self) -> bool:
+        return await self.completions.batch_inference()
+
+    @property
+    def base_url(self) -> "httpx.URL":
+        return self.lls_client.base_url
+
+    async def get(self, *args, **kwargs):
+        return await self.lls_client.get(*args, **kwargs)
@@ -0,0 +1,63 @@
+# Standard
+from concurrent.futures import Future
+import threading
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.items = []
+        self.futures = []
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    # Collects items submitted from many threads into batches. Items
+    # with the same group key submitted within `max_wait` seconds of
+    # each other, up to `max_batch_size` of them, are handed to
+    # `execute(group_key, items)` together, which must return one
+    # result per item in the same order.
+    #
+    # There is no background thread: the first caller of each batch
+    # waits for it to fill up (or for the window to pass) and then runs
+    # it, while everyone else in the batch waits for their result.
+
+    def __init__(self, execute, max_batch_size: int = 32, max_wait: float = 0.005):
+        if max_batch_size < 1:
+            raise ValueError("`max_batch_size` must be at least 1.")
+        self.execute = execute
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._pending: dict[object, _PendingBatch] = {}
+
+    def submit(self, group_key, item):
+        future = Future()
+        with self._lock:
+            batch = self._pending.get(group_key, None)
+            leader = batch is None
+            if leader:
+                batch = self._pending[group_key] = _PendingBatch()
+            batch.items.append(item)
+            batch.futures.append(future)
+            if len(batch.items) >= self.max_batch_size:
+                # no more room, so the next item starts a new batch
+                del self._pending[group_key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._pending.get(group_key, None) is batch:
+                    del self._pending[group_key]
+            self._run(group_key, batch)
+        return future.result()
+
+    def _run(self, group_key, batch):
+        try:
+            results = self.execute(group_key, batch.items)
+        except BaseException as err:  # pylint: disable=broad-exception-caught
+            for future in batch.futures:
+                future.set_exception(err)
+        else:
+            for future, result in zip(batch.futures, results):
+                future.set_result(result)
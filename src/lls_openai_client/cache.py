@@ -0,0 +1,306 @@
+# Standard
+from collections import OrderedDict
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+@functools.cache
+def _value_types():
+    # The only types persistent caches will store and load, imported on
+    # first use to keep openai out of the import of this module
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from openai.types.chat.chat_completion import Choice as OpenAIChatCompletionChoice
+    from openai.types.completion_choice import (
+        CompletionChoice as OpenAICompletionChoice,
+    )
+
+    return {
+        "chat_completion_choice": OpenAIChatCompletionChoice,
+        "completion_choice": OpenAICompletionChoice,
+    }
+
+
+@functools.cache
+def _value_type_names():
+    return {value_type: name for name, value_type in _value_types().items()}
+
+
+def request_cache_key(*parts) -> str:
+    # Requests are made of plain dicts, lists and strings by the time
+    # they reach Llama Stack, so a sorted JSON dump is a stable
+    # canonical form to hash
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class EvictionPolicy:
+    # Decides which key an InMemoryCache drops when it is over its
+    # bounds. The cache calls these with its lock held.
+
+    def on_get(self, key):
+        pass
+
+    def on_set(self, key):
+        raise NotImplementedError
+
+    def on_delete(self, key):
+        raise NotImplementedError
+
+    def victim(self):
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+    def __init__(self):
+        self._keys = OrderedDict()
+
+    def on_get(self, key):
+        self._keys.move_to_end(key)
+
+    def on_set(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+
+    def on_delete(self, key):
+        self._keys.pop(key, None)
+
+    def victim(self):
+        return next(iter(self._keys))
+
+
+class FIFOPolicy(LRUPolicy):
+    def on_get(self, key):
+        # reads don't change the eviction order
+        pass
+
+    def on_set(self, key):
+        if key not in self._keys:
+            self._keys[key] = None
+
+
+class ResponseCache:
+    # Storage for cached responses. Values are OpenAI choice objects,
+    # keyed by request_cache_key.
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class InMemoryCache(ResponseCache):
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int | None = None,
+        policy: EvictionPolicy | None = None,
+    ):
+        if max_entries < 1:
+            raise ValueError("`max_entries` must be at least 1.")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy or LRUPolicy()
+        self._entries: dict[str, tuple[object, int]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return None
+            self.policy.on_get(key)
+            return entry[0]
+
+    def set(self, key, value):
+        size = len(value.model_dump_json()) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # would evict everything else and still not fit
+            return
+        with self._lock:
+            self._delete(key)
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self.policy.on_set(key)
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._delete(self.policy.victim())
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._delete(key)
+
+    def _delete(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+            self.policy.on_delete(key)
+
+
+class TieredCache(ResponseCache):
+    # Checks a fast cache (usually an InMemoryCache) before a slower,
+    # larger one (usually a SQLiteCache), filling the fast one on hits
+
+    def __init__(self, fast: ResponseCache, slow: ResponseCache):
+        self.fast = fast
+        self.slow = slow
+
+    def get(self, key):
+        value = self.fast.get(key)
+        if value is None:
+            value = self.slow.get(key)
+            if value is not None:
+                self.fast.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.fast.set(key, value)
+        self.slow.set(key, value)
+
+    def clear(self):
+        self.fast.clear()
+        self.slow.clear()
+
+
+class SQLiteCache(ResponseCache):  # pylint: disable=too-many-instance-attributes
+    # A durable cache that survives restarts. SQLite's WAL mode lets
+    # any number of threads and processes read while one writes, and
+    # every write is committed before set() returns.
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        compact_every: int = 1000,
+        timeout: float = 30.0,
+    ):
+        self.path = os.fspath(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compact_every = compact_every
+        self.timeout = timeout
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        # Every thread's connection, so close() can close them all
+        self._connections: set[sqlite3.Connection] = set()
+        self._connections_lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value_type TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created ON responses (created)"
+            )
+        self.compact()
+
+    def _connect(self):
+        # sqlite3 connections can't be shared across threads, so each
+        # thread gets its own. One that close() has closed is replaced.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn not in self._connections:
+            # Only this thread uses the connection, but close() may close
+            # it from another
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._connections_lock:
+                self._connections.add(conn)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        query = "SELECT value_type, value FROM responses WHERE key = ?"
+        args = [key]
+        if self.ttl is not None:
+            query += " AND created >= ?"
+            args.append(time.time() - self.ttl)
+        row = self._connect().execute(query, args).fetchone()
+        if row is None:
+            return None
+        value_type = _value_types().get(row[0], None)
+        if value_type is None:
+            return None
+        return value_type.model_validate_json(row[1])
+
+    def set(self, key, value):
+        value_type = _value_type_names().get(type(value), None)
+        if value_type is None:
+            raise TypeError(f"Cannot persist values of type {type(value).__name__}")
+        data = value.model_dump_json()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, value_type, value, size, created) VALUES (?, ?, ?, ?, ?)",
+                (key, value_type, data, len(data), time.time()),
+            )
+
+        with self._writes_lock:
+            self._writes += 1
+            compact = self._writes % self.compact_every == 0
+        if compact:
+            self.compact()
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def compact(self):
+        # Drops expired entries, then the oldest entries until the cache
+        # is back within its bounds
+        with self._connect() as conn:
+            if self.ttl is not None:
+                conn.execute(
+                    "DELETE FROM responses WHERE created < ?",
+                    (time.time() - self.ttl,),
+                )
+            if self.max_entries is not None:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY created DESC"
+                    " LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            if self.max_bytes is not None:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM ("
+                    "  SELECT key, SUM(size) OVER (ORDER BY created DESC, key)"
+                    "  AS total FROM responses)"
+                    " WHERE total > ?)",
+                    (self.max_bytes,),
+                )
+
+    def close(self):
+        # Closes the connections of every thread that used this cache
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
@@ -1,36 +1,50 @@
 # Standard
-import json
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+import functools
+import itertools
+import queue
+import threading
 import time
 import uuid
 
-# Third Party
-from llama_stack_client import LlamaStackClient
-from llama_stack_client.types.inference_chat_completion_params import Tool, ToolConfig
-from llama_stack_client.types.shared_params.response_format import (
-    JsonSchemaResponseFormat,
+# Local
+from .batching import MicroBatcher
+from .cache import ResponseCache, request_cache_key
+from .json_backend import json_loads
+from .limits import (
+    AdaptiveLimiter,
+    AsyncAdaptiveLimiter,
+    AsyncRateLimiter,
+    LimitedClient,
+    RateLimitedClient,
+    RateLimiter,
 )
-from llama_stack_client.types.shared_params.sampling_params import (
-    SamplingParams,
-    StrategyGreedySamplingStrategy,
-    StrategyTopPSamplingStrategy,
+from .models import ModelCatalog
+from .planning import (
+    _BATCH_COMPLETION_ROUTE,
+    _BatchState,
+    _ChatCompletionRequest,
+    _chunked,
+    _CompletionRequest,
+    _is_not_implemented,
+    _llm_ids,
+    _MessageConverter,
+    _RequestPlan,
 )
-from llama_stack_client.types.shared_params.tool_param_definition import (
-    ToolParamDefinition,
-)
-from openai.types.chat.chat_completion import ChatCompletion as OpenAIChatCompletion
-from openai.types.chat.chat_completion import Choice as OpenAIChatCompletionChoice
-from openai.types.chat.chat_completion_message import (
-    ChatCompletionMessage as OpenAIChatCompletionMessage,
-)
-from openai.types.chat.chat_completion_message_tool_call import (
-    ChatCompletionMessageToolCall as OpenAIChatCompletionMessageToolCall,
-)
-from openai.types.chat.chat_completion_message_tool_call import (
-    Function as OpenAIChatCompletionFunction,
-)
-from openai.types.completion import Completion as OpenAICompletion
-from openai.types.completion_choice import CompletionChoice as OpenAICompletionChoice
-import httpx
+from .pool import LlamaStackPool
+from .tools import ToolRegistry
+
+if TYPE_CHECKING:
+    # Third Party
+    from llama_stack_client import LlamaStackClient
+    from llama_stack_client.types.shared_params.sampling_params import SamplingParams
+    import httpx
+
+# openai and llama_stack_client take far longer to import than the rest
+# of this package, so they are only imported once actually needed. The
+# llama_stack_client request types are plain TypedDicts and are built as
+# dicts; the openai response types are imported on first use.
 
 _STOP_REASON_MAP = {
     "end_of_message": "tool_calls",
@@ -43,257 +57,962 @@ def _map_stop_reason(lls_stop_reason: str) -> str:
     return _STOP_REASON_MAP.get(lls_stop_reason, "")
 
 
-def _convert_request_messages(messages):
-    # Llama Stack messages and OpenAI messages are similar, but not
-    # identical. Specifically, Llama Stack expects `call_id` but
-    # OpenAi uses `tool_call_id`
-    lls_messages = []
-    for message in messages:
-        lls_message = message.copy()
-        tool_call_id = lls_message.pop("tool_call_id", None)
-        if tool_call_id:
-            lls_message["call_id"] = tool_call_id
-        lls_messages.append(lls_message)
-    return lls_messages
-
-
-def _parse_request_response_format(params):
-    response_format = None
-    extra_body = params.get("extra_body", {})
-    guided_choice = extra_body.get("guided_choice", [])
-    if guided_choice:
-        pattern_choices = "|".join(guided_choice)
-        schema = {
-            "type": "string",
-            "pattern": f"^({pattern_choices})$",
-        }
-        response_format = JsonSchemaResponseFormat(
-            type="json_schema",
-            json_schema=schema,
-        )
-    return response_format
+def _map_ordered(executor, fn, items):
+    # Results are always returned in the same order as `items`, whether
+    # the calls were made serially or fanned out across the executor
+    if executor is None:
+        return [fn(item) for item in items]
+    return list(executor.map(fn, items))
+
+
+def _map_unordered(executor, fn, items, max_pending):
+    # Yields (item, result) pairs as each call finishes. At most
+    # `max_pending` calls are submitted but not yet yielded at any time,
+    # so a slow consumer holds back new calls instead of piling up
+    # results.
+    if executor is None:
+        for item in items:
+            yield item, fn(item)
+        return
+
+    items = iter(items)
+    pending = {}
+    try:
+        for item in itertools.islice(items, max_pending):
+            pending[executor.submit(fn, item)] = item
+        while pending:
+            done, _not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                for next_item in itertools.islice(items, 1):
+                    pending[executor.submit(fn, next_item)] = next_item
+                yield item, future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+_STREAM_DONE = object()
+
+
+def _merge_streams(executor, open_streams):
+    # Yields (index, item) pairs from several streams, where `index` is
+    # the position of the stream's opener in `open_streams`. With an
+    # executor the streams are consumed concurrently and their items
+    # interleaved as they arrive, otherwise they are consumed in turn.
+    if executor is None:
+        for index, open_stream in enumerate(open_streams):
+            for item in open_stream():
+                yield index, item
+        return
+
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def _pump(index):
+        try:
+            for item in open_streams[index]():
+                if stop.is_set():
+                    break
+                items.put((index, item, None))
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            items.put((index, _STREAM_DONE, err))
+        else:
+            items.put((index, _STREAM_DONE, None))
+
+    futures = [executor.submit(_pump, i) for i in range(len(open_streams))]
+    remaining = len(futures)
+    try:
+        while remaining:
+            index, item, err = items.get()
+            if item is _STREAM_DONE:
+                if err is not None:
+                    raise err
+                remaining -= 1
+                continue
+            yield index, item
+    finally:
+        # the caller may stop iterating early, so tell any streams still
+        # running to stop as well
+        stop.set()
+        for future in futures:
+            future.cancel()
+
+
+class _SingleFlight:
+    # Coalesces identical calls made at the same time from different
+    # threads, so only the first (the leader) does the work and the
+    # rest wait for and share its result
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn()
+        except BaseException as err:
+            call.set_exception(err)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result
+
+
+def _coalesce(single_flight, key, fn):
+    if single_flight is None or key is None:
+        return fn()
+    return single_flight.do(key, fn)
+
+
+_WARMUP_PROMPT = "Hello"
+_WARMUP_SAMPLING_PARAMS: "SamplingParams" = {
+    "max_tokens": 1,
+    "strategy": {"type": "greedy"},
+}
 
 
-def _parse_request_sampling_params(params):
-    sampling_params = SamplingParams()
+def _detect_batch_inference(lls_client) -> bool | None:
+    # Makes up to three calls to Llama Stack: it lists the routes, lists
+    # the models and sends an empty batch to the first LLM. Returns None
+    # when it can't tell, e.g. the server is unreachable or has no LLMs
+    # registered yet, so support can be detected again later.
+    try:
+        routes = lls_client.routes.list()
+        if not any(route.route == _BATCH_COMPLETION_ROUTE for route in routes):
+            return False
+
+        # The route is registered for every inference provider, even
+        # ones that do not implement it, so probe an actual model with
+        # an empty batch to find out for sure
+        llms = _llm_ids(lls_client.models.list())
+        if not llms:
+            return None
+        lls_client.inference.batch_completion(model_id=llms[0], content_batch=[])
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        return False if _is_not_implemented(err) else None
+    return True
+
+
+class _BatchSupport(_BatchState):
+    @property
+    def enabled(self) -> bool:
+        # The first use detects support (see _detect_batch_inference)
+        if self._should_detect():
+            return self._detected(_detect_batch_inference(self.lls_client))
+        return bool(self._enabled)
+
+    @enabled.setter
+    def enabled(self, value: bool):
+        self._enabled = value
+
+    def supports(self, api, model_id) -> bool:
+        return self._may_batch(api, model_id) and self.enabled
+
+    def call(self, api, model_id, fn):
+        # Returns the batch from fn(), or None if the model's provider
+        # can't do batches
+        try:
+            return fn().batch
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            self._failed(api, model_id, err)
+        return None
+
+
+def _wrap_client(llama_stack_client, pool_class, limiter, rate_limiter):
+    # A list of clients, replicas of the same stack, becomes a pool.
+    # Inference calls are then held to the concurrency `limiter`, and to
+    # the `rate_limiter`'s budget of requests and tokens per second,
+    # which they wait for before taking a place under the limit.
+    if isinstance(llama_stack_client, (list, tuple)) and llama_stack_client:
+        llama_stack_client = pool_class(llama_stack_client)
+    if not llama_stack_client:
+        raise ValueError("A `llama_stack_client` must be provided.")
+    if limiter is not None:
+        llama_stack_client = LimitedClient(llama_stack_client, limiter)
+    if rate_limiter is not None:
+        llama_stack_client = RateLimitedClient(llama_stack_client, rate_limiter)
+    return llama_stack_client
 
-    max_tokens = params.get("max_tokens", None)
-    if max_tokens:
-        sampling_params["max_tokens"] = max_tokens
 
-    temperature = params.get("temperature", 1.0)
-    if temperature == 0:
-        strategy = StrategyGreedySamplingStrategy(type="greedy")
-    else:
-        top_p = params.get("top_p", 1.0)
-        strategy = StrategyTopPSamplingStrategy(
-            type="top_p",
-            temperature=temperature,
-            top_p=top_p,
+def _parse_response_tool_calls(completion_message):
+    return [
+        {
+            "id": tool_call.call_id,
+            "function": {
+                "arguments": tool_call.arguments_json,
+                "name": tool_call.tool_name,
+            },
+            "type": "function",
+        }
+        for tool_call in completion_message.tool_calls
+    ]
+
+
+def _build_completion_choice(index, lls_result, response_format, guided_choice=None):
+    text = lls_result.content
+    if guided_choice is not None and text in guided_choice.outputs:
+        text = guided_choice.outputs[text]
+    elif response_format and response_format.get("json_schema", None):
+        try:
+            text = json_loads(lls_result.content)
+        except ValueError:
+            # invalid JSON, so just leave the text as the raw content
+            pass
+
+    return {
+        "index": index,
+        "text": text,
+        "finish_reason": _map_stop_reason(lls_result.stop_reason),
+    }
+
+
+def _build_completion_chunk(completion_id, created, model_id, index, lls_chunk):
+    # Llama Stack streams the new text as `delta`, which the client
+    # types don't always declare, so fall back to `content`
+    text = getattr(lls_chunk, "delta", None)
+    if text is None:
+        text = getattr(lls_chunk, "content", "")
+    finish_reason = None
+    if getattr(lls_chunk, "stop_reason", None):
+        finish_reason = _map_stop_reason(lls_chunk.stop_reason) or None
+    if not text and finish_reason is None:
+        return None
+
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from openai.types.completion import Completion as OpenAICompletion
+    from openai.types.completion_choice import (
+        CompletionChoice as OpenAICompletionChoice,
+    )
+
+    # Streamed choices have no finish_reason until the last chunk, which
+    # CompletionChoice does not allow, so build these without validation
+    # just like the OpenAI client does for streamed responses
+    choice = OpenAICompletionChoice.construct(
+        index=index,
+        text=text,
+        finish_reason=finish_reason,
+        logprobs=None,
+    )
+    return OpenAICompletion.construct(
+        id=completion_id,
+        choices=[choice],
+        created=created,
+        model=model_id,
+        object="text_completion",
+    )
+
+
+def _build_completion(model_id, choices):
+    # Choices are built as plain dicts and the whole response validated
+    # in one go, which for large batches is much cheaper than creating
+    # each nested model separately. Cached choices are already models
+    # and are taken as they are.
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from openai.types.completion import Completion as OpenAICompletion
+
+    return OpenAICompletion.model_validate(
+        {
+            "id": f"cmpl-{uuid.uuid4()}",
+            "choices": choices,
+            "created": int(time.time()),
+            "model": model_id,
+            "object": "text_completion",
+        }
+    )
+
+
+def _build_chat_completion_choice(index, lls_result):
+    completion_message = lls_result.completion_message
+    return {
+        "index": index,
+        "message": {
+            "role": completion_message.role,
+            "content": completion_message.content or "",
+            "tool_calls": _parse_response_tool_calls(completion_message),
+        },
+        "finish_reason": _map_stop_reason(completion_message.stop_reason),
+    }
+
+
+def _build_chat_completion(model_id, choices):
+    # see _build_completion
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from openai.types.chat.chat_completion import ChatCompletion as OpenAIChatCompletion
+
+    return OpenAIChatCompletion.model_validate(
+        {
+            "id": f"chatcmpl-{uuid.uuid4()}",
+            "choices": choices,
+            "created": int(time.time()),
+            "model": model_id,
+            "object": "chat.completion",
+        }
+    )
+
+
+def _build_chat_completion_chunk(completion_id, created, model_id, choice):
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from openai.types.chat.chat_completion_chunk import (
+        ChatCompletionChunk as OpenAIChatCompletionChunk,
+    )
+
+    return OpenAIChatCompletionChunk(
+        id=completion_id,
+        choices=[choice],
+        created=created,
+        model=model_id,
+        object="chat.completion.chunk",
+    )
+
+
+class _ChatCompletionStreamConverter:
+    # Turns the Llama Stack stream for a single choice into OpenAI chunk
+    # choices, tracking the state that spans multiple chunks
+
+    def __init__(self, index):
+        self.index = index
+        self.sent_role = False
+        self.tool_call_index = 0
+
+    def convert(self, lls_chunk):
+        # Third Party
+        # pylint: disable=import-outside-toplevel
+        from openai.types.chat.chat_completion_chunk import (
+            Choice as OpenAIChatCompletionChunkChoice,
+        )
+        from openai.types.chat.chat_completion_chunk import (
+            ChoiceDelta as OpenAIChatCompletionChunkDelta,
+        )
+        from openai.types.chat.chat_completion_chunk import (
+            ChoiceDeltaToolCall as OpenAIChatCompletionChunkToolCall,
+        )
+        from openai.types.chat.chat_completion_chunk import (
+            ChoiceDeltaToolCallFunction as OpenAIChatCompletionChunkFunction,
         )
-    sampling_params["strategy"] = strategy
 
-    return sampling_params
+        event = lls_chunk.event
+        delta = event.delta
+        content = None
+        tool_calls = None
+        if delta.type == "text":
+            content = delta.text
+        elif delta.type == "tool_call" and delta.parse_status == "succeeded":
+            # Llama Stack streams the raw text of a tool call while it's
+            # being parsed, but OpenAI clients expect the name and
+            # arguments, so only emit it once fully parsed
+            tool_call = delta.tool_call
+            tool_calls = [
+                OpenAIChatCompletionChunkToolCall(
+                    index=self.tool_call_index,
+                    id=tool_call.call_id,
+                    function=OpenAIChatCompletionChunkFunction(
+                        arguments=tool_call.arguments_json,
+                        name=tool_call.tool_name,
+                    ),
+                    type="function",
+                )
+            ]
+            self.tool_call_index += 1
+
+        finish_reason = None
+        if event.event_type == "complete":
+            finish_reason = _map_stop_reason(event.stop_reason) or None
+
+        role = None
+        if not self.sent_role:
+            role = "assistant"
+            self.sent_role = True
+        elif not content and tool_calls is None and finish_reason is None:
+            # nothing new to tell the client
+            return None
+
+        return OpenAIChatCompletionChunkChoice(
+            index=self.index,
+            delta=OpenAIChatCompletionChunkDelta(
+                role=role,
+                content=content,
+                tool_calls=tool_calls,
+            ),
+            finish_reason=finish_reason,
+        )
 
 
-def _parse_request_tool_config(params):
-    tool_config = None
-    tool_choice = params.get("tool_choice", None)
-    if tool_choice:
-        tool_config = ToolConfig(
-            tool_choice=tool_choice,
+def _completion_response(request, plan, unique_results):
+    # Builds the response from the results of the request's unique calls
+    # and caches its new choices
+    choices = plan.fill(
+        unique_results,
+        lambda i, lls_result: _build_completion_choice(
+            i, lls_result, request.response_format, request.guided_choice
+        ),
+    )
+    response = _build_completion(request.model_id, choices)
+    plan.store(response.choices)
+    return response
+
+
+def _completion_choices(request, plan, unique_i, lls_result):
+    # The choices sharing the result of unique call `unique_i`, built and
+    # cached on their own as create_iter yields them
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from openai.types.completion_choice import (
+        CompletionChoice as OpenAICompletionChoice,
+    )
+
+    choices = {
+        i: OpenAICompletionChoice.model_validate(
+            _build_completion_choice(
+                i, lls_result, request.response_format, request.guided_choice
+            )
         )
-    return tool_config
-
-
-def _parse_request_tools(params):
-    tools = params.get("tools", None)
-    lls_tools = []
-    if tools and isinstance(tools, list):
-        for tool in tools:
-            tool_fn = tool.get("function", {})
-            tool_name = tool_fn.get("name", None)
-            tool_desc = tool_fn.get("description", None)
-
-            tool_params = tool_fn.get("parameters", None)
-            lls_tool_params = {}
-            if tool_params is not None:
-                tool_param_properties = tool_params.get("properties", {})
-                for tool_param_key, tool_param_value in tool_param_properties.items():
-                    tool_param_def = ToolParamDefinition(
-                        param_type=tool_param_value.get("type", None),
-                        description=tool_param_value.get("description", None),
-                    )
-                    lls_tool_params[tool_param_key] = tool_param_def
-
-            lls_tool = Tool(
-                tool_name=tool_name,
-                description=tool_desc,
-                parameters=lls_tool_params,
+        for i in plan.sharing_of(unique_i)
+    }
+    plan.store(choices, [unique_i])
+    return list(choices.values())
+
+
+def _completion_chunk_builder(model_id):
+    # Every chunk of a stream shares the same id and creation time
+    return functools.partial(
+        _build_completion_chunk, f"cmpl-{uuid.uuid4()}", int(time.time()), model_id
+    )
+
+
+def _chat_completion_response(request, plan, unique_results):
+    # see _completion_response
+    choices = plan.fill(unique_results, _build_chat_completion_choice)
+    response = _build_chat_completion(request.model_id, choices)
+    plan.store(response.choices)
+    return response
+
+
+def _chat_completion_chunk_builder(model_id, n):
+    # Each of the n choices is its own stream, with every chunk tagged by
+    # its choice index
+    completion_id = f"chatcmpl-{uuid.uuid4()}"
+    created = int(time.time())
+    converters = [_ChatCompletionStreamConverter(i) for i in range(n)]
+
+    def _build(index, lls_chunk):
+        choice = converters[index].convert(lls_chunk)
+        if choice is None:
+            return None
+        return _build_chat_completion_chunk(completion_id, created, model_id, choice)
+
+    return _build
+
+
+def _conform(request, indices, lls_results, guided_choice_retries, regenerate):
+    # Retries the guided_choice outputs that aren't one of the choices,
+    # all at once with `regenerate`, raising if any still isn't after
+    # guided_choice_retries attempts. None skips checking the outputs.
+    guided_choice = request.guided_choice
+    if guided_choice is None or guided_choice_retries is None:
+        return lls_results
+    lls_results = dict(zip(indices, lls_results))
+    for _attempt in range(request.retries(guided_choice_retries)):
+        retry = guided_choice.nonconforming(
+            {
+                i: request.output_text(lls_result)
+                for i, lls_result in lls_results.items()
+            }
+        )
+        if not retry:
+            break
+        lls_results.update(zip(retry, regenerate(retry)))
+    for i in indices:
+        guided_choice.check(request.output_text(lls_results[i]))
+    return [lls_results[i] for i in indices]
+
+
+class _InferenceResource:
+    # What the completions and chat completions resources, sync and
+    # async, all hold
+    _batch_support_class: type[_BatchState] = _BatchSupport
+
+    def __init__(
+        self,
+        llama_stack_client,
+        batch_inference=None,
+        cache=None,
+        single_flight=None,
+        model_catalog=None,
+        guided_choice_retries=None,
+    ):
+        self.lls_client = llama_stack_client
+        self.cache = cache
+        self.single_flight = single_flight
+        # None skips checking guided_choice outputs against the choices
+        self.guided_choice_retries = guided_choice_retries
+        # Requests for unknown models fail before anything is sent
+        self.model_catalog = model_catalog
+        if not isinstance(batch_inference, self._batch_support_class):
+            batch_inference = self._batch_support_class(
+                self.lls_client, batch_inference
+            )
+        self.batch_support = batch_inference
+
+
+class Completions(_InferenceResource):
+    def __init__(
+        self,
+        llama_stack_client,
+        executor=None,
+        micro_batch_max_size=None,
+        micro_batch_max_wait=0.005,
+        max_concurrency=1,
+        **kwargs,
+    ):
+        super().__init__(llama_stack_client, **kwargs)
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+
+        # Single-prompt requests from concurrent callers can be gathered
+        # into batches, when Llama Stack supports batch inference
+        self.micro_batcher = None
+        if micro_batch_max_size is not None and micro_batch_max_size > 1:
+            self.micro_batcher = MicroBatcher(
+                self._complete_micro_batch,
+                max_batch_size=micro_batch_max_size,
+                max_wait=micro_batch_max_wait,
             )
-            lls_tools.append(lls_tool)
-    return lls_tools
 
+    @property
+    def batch_inference(self) -> bool:
+        return self.batch_support.enabled
+
+    def _supports_batch(self, model_id):
+        return self.batch_support.supports("completion", model_id)
+
+    def _batch_complete(self, params):
+        if len(params["content_batch"]) < 2 or not self._supports_batch(
+            params["model_id"]
+        ):
+            return None
+        return self.batch_support.call(
+            "completion",
+            params["model_id"],
+            lambda: self.lls_client.inference.batch_completion(**params),
+        )
 
-def _parse_response_tool_calls(completion_message):
-    tool_calls = []
-    for tool_call in completion_message.tool_calls:
-        function = OpenAIChatCompletionFunction(
-            arguments=tool_call.arguments_json,
-            name=tool_call.tool_name,
+    def _complete(self, request, i):
+        return request.bind(self.lls_client.inference.completion, i)()
+
+    def _complete_once(self, request, plan, i):
+        # the same greedy call in flight from elsewhere is only made once
+        return _coalesce(
+            self.single_flight,
+            plan.key(i),
+            functools.partial(self._complete, request, i),
         )
-        tool_calls.append(
-            OpenAIChatCompletionMessageToolCall(
-                id=tool_call.call_id,
-                function=function,
-                type="function",
+
+    def _complete_batch_of(self, request, plan, indices):
+        # A single batch completion for the choices at `indices`, or one
+        # completion each if the model's provider can't do batches
+        lls_results = self._batch_complete(request.batch_params(indices))
+        if lls_results is None:
+            lls_results = _map_ordered(
+                self.executor,
+                functools.partial(self._complete_once, request, plan),
+                indices,
             )
+        return zip(indices, lls_results)
+
+    def _conform(self, request, indices, lls_results):
+        # retries go out all at once over the executor
+        return _conform(
+            request,
+            indices,
+            lls_results,
+            self.guided_choice_retries,
+            functools.partial(
+                _map_ordered, self.executor, functools.partial(self._complete, request)
+            ),
         )
-    return tool_calls
 
+    def _complete_micro_batch(self, _group_key, items):
+        # every item in a group shares the same model and parameters
+        params = items[0][0].batch_params([])
+        params["content_batch"] = [request.content_batch[i] for request, i in items]
+        lls_results = self._batch_complete(params)
+        if lls_results is None:
+            lls_results = _map_ordered(
+                self.executor, lambda item: self._complete(*item), items
+            )
+        return lls_results
 
-class Completions:
-    def __init__(self, llama_stack_client):
-        self.lls_client = llama_stack_client
+    def _check_model(self, model_id):
+        if self.model_catalog is not None:
+            self.model_catalog.check(model_id)
 
     def create(self, *_args, **kwargs):
-        model_id = kwargs.get("model", None)
-        prompts = kwargs.get("prompt", None)
-        n = kwargs.get("n", 1)
-
-        # TODO: This is a pretty hacky way to do batch completions -
-        # basically just de-batches them...
-        if not isinstance(prompts, list):
-            prompts = [prompts]
-
-        response_format = _parse_request_response_format(kwargs)
-        sampling_params = _parse_request_sampling_params(kwargs)
-
-        choices = []
-        # "n" is the number of completions to generate per prompt
-        for _i in range(0, n):
-            # and we may have multiple prompts, if batching was used
-
-            # TODO: see if this can get wired up to LlamaStack's batch
-            # inference API
-            for prompt in prompts:
-                lls_result = self.lls_client.inference.completion(
-                    model_id=model_id,
-                    content=prompt,
-                    sampling_params=sampling_params,
-                    response_format=response_format,
+        request = _CompletionRequest(kwargs)
+        self._check_model(request.model_id)
+        if kwargs.get("stream", False):
+            return self._create_stream(request)
+
+        # Greedy requests for the same prompt always get the same result,
+        # so each unique prompt is only sent once
+        plan = _RequestPlan(
+            request, len(request.content_batch), self.cache, self.single_flight
+        )
+        if (
+            len(plan.unique) == 1
+            and self.micro_batcher is not None
+            and self._supports_batch(request.model_id)
+        ):
+            i = plan.unique[0]
+            group_key = request_cache_key(
+                "completion_batch",
+                request.model_id,
+                request.sampling_params,
+                request.response_format,
+            )
+            unique_results = [
+                _coalesce(
+                    self.single_flight,
+                    plan.key(i),
+                    lambda: self.micro_batcher.submit(group_key, (request, i)),
                 )
+            ]
+        else:
+            # Send everything as a single batch when Llama Stack supports
+            # it, otherwise de-batch into individual completions
+            unique_results = self._batch_complete(request.batch_params(plan.unique))
+        if unique_results is None:
+            unique_results = _map_ordered(
+                self.executor,
+                functools.partial(self._complete_once, request, plan),
+                plan.unique,
+            )
 
-                text = lls_result.content
-                if response_format and response_format.get("json_schema", None):
-                    try:
-                        text = json.loads(lls_result.content)
-                    except json.decoder.JSONDecodeError:
-                        # invalid JSON, so just leave the text as the raw content
-                        pass
-
-                choice = OpenAICompletionChoice(
-                    index=len(choices),
-                    text=text,
-                    finish_reason=_map_stop_reason(lls_result.stop_reason),
-                )
-                choices.append(choice)
-
-        return OpenAICompletion(
-            id=f"cmpl-{uuid.uuid4()}",
-            choices=choices,
-            created=int(time.time()),
-            model=model_id,
-            object="text_completion",
+        unique_results = self._conform(request, plan.unique, unique_results)
+        return _completion_response(request, plan, unique_results)
+
+    def create_iter(self, *_args, **kwargs):
+        # Yields the choices a non-streaming create() would return, one at
+        # a time in the order they finish, so huge batches can be consumed
+        # without holding the whole response in memory
+        if kwargs.get("stream", False):
+            raise ValueError("`create_iter` does not support streaming.")
+        request = _CompletionRequest(kwargs)
+        self._check_model(request.model_id)
+        plan = _RequestPlan(
+            request, len(request.content_batch), self.cache, self.single_flight
         )
+        yield from (choice for choice in plan.choices if choice is not None)
+
+        if (
+            len(plan.unique) > 1
+            and self.max_concurrency > 1
+            and self._supports_batch(request.model_id)
+        ):
+            # Batches of max_concurrency prompts are sent one at a time,
+            # so each batch's choices are yielded before the next is sent
+            finished = itertools.chain.from_iterable(
+                self._complete_batch_of(request, plan, indices)
+                for indices in _chunked(plan.unique, self.max_concurrency)
+            )
+        else:
+            finished = _map_unordered(
+                self.executor,
+                functools.partial(self._complete_once, request, plan),
+                plan.unique,
+                self.max_concurrency,
+            )
 
+        for unique_i, lls_result in finished:
+            (lls_result,) = self._conform(request, [unique_i], [lls_result])
+            yield from _completion_choices(request, plan, unique_i, lls_result)
+
+    def _create_stream(self, request):
+        build_chunk = _completion_chunk_builder(request.model_id)
+        open_streams = request.stream_openers(self.lls_client.inference.completion)
+        for index, lls_chunk in _merge_streams(self.executor, open_streams):
+            chunk = build_chunk(index, lls_chunk)
+            if chunk is not None:
+                yield chunk
+
+
+class ChatCompletions(_InferenceResource):
+    def __init__(
+        self,
+        llama_stack_client,
+        executor=None,
+        tool_registry=None,
+        message_converter=None,
+        **kwargs,
+    ):
+        super().__init__(llama_stack_client, **kwargs)
+        self.executor = executor
+        self.tool_registry = tool_registry
+        if message_converter is None:
+            message_converter = _MessageConverter()
+        self.message_converter = message_converter
+
+    def _batch_chat_complete(self, request, count):
+        if count < 2 or not self.batch_support.supports(
+            "chat_completion", request.model_id
+        ):
+            return None
+        return self.batch_support.call(
+            "chat_completion",
+            request.model_id,
+            lambda: self.lls_client.inference.batch_chat_completion(
+                **request.batch_params(count)
+            ),
+        )
 
-class ChatCompletions:
-    def __init__(self, llama_stack_client):
-        self.lls_client = llama_stack_client
+    def _chat_complete_once(self, request, plan, i):
+        return _coalesce(
+            self.single_flight,
+            plan.key(i),
+            request.bind(self.lls_client.inference.chat_completion),
+        )
 
-    def create(self, *_args, **kwargs):
-        model_id = kwargs.get("model", None)
-        messages = _convert_request_messages(kwargs.get("messages", None))
-        n = kwargs.get("n", 1)
-        response_format = _parse_request_response_format(kwargs)
-        sampling_params = _parse_request_sampling_params(kwargs)
-        tool_config = _parse_request_tool_config(kwargs)
-        tools = _parse_request_tools(kwargs)
-
-        choices = []
-        # "n" is the number of completions to generate per prompt
-        for i in range(0, n):
-            lls_result = self.lls_client.inference.chat_completion(
-                model_id=model_id,
-                messages=messages,
-                sampling_params=sampling_params,
-                response_format=response_format,
-                tool_config=tool_config,
-                tools=tools,
-            )
+    def _conform(self, request, indices, lls_results):
+        # see Completions._conform
+        chat_complete = request.bind(self.lls_client.inference.chat_completion)
+        return _conform(
+            request,
+            indices,
+            lls_results,
+            self.guided_choice_retries,
+            functools.partial(_map_ordered, self.executor, lambda _i: chat_complete()),
+        )
 
-            completion_message = lls_result.completion_message
-            tool_calls = _parse_response_tool_calls(completion_message)
-            message = OpenAIChatCompletionMessage(
-                role=completion_message.role,
-                content=completion_message.content or "",
-                tool_calls=tool_calls,
+    def create(self, *_args, **kwargs):
+        if self.model_catalog is not None:
+            self.model_catalog.check(kwargs.get("model", None))
+        request = _ChatCompletionRequest(
+            kwargs, self.tool_registry, self.message_converter
+        )
+        if kwargs.get("stream", False):
+            return self._create_stream(request)
+
+        # all n choices of a greedy request are the same, so only one
+        # needs to be generated
+        plan = _RequestPlan(request, request.n, self.cache, self.single_flight)
+        unique_results = self._batch_chat_complete(request, len(plan.unique))
+        if unique_results is None:
+            unique_results = _map_ordered(
+                self.executor,
+                functools.partial(self._chat_complete_once, request, plan),
+                plan.unique,
             )
+        unique_results = self._conform(request, plan.unique, unique_results)
+        return _chat_completion_response(request, plan, unique_results)
 
-            choice = OpenAIChatCompletionChoice(
-                index=i,
-                message=message,
-                finish_reason=_map_stop_reason(completion_message.stop_reason),
-            )
-            choices.append(choice)
-
-        return OpenAIChatCompletion(
-            id=f"chatcmpl-{uuid.uuid4()}",
-            choices=choices,
-            created=int(time.time()),
-            model=model_id,
-            object="chat.completion",
-        )
+    def _create_stream(self, request):
+        build_chunk = _chat_completion_chunk_builder(request.model_id, request.n)
+        open_streams = request.stream_openers(self.lls_client.inference.chat_completion)
+        for index, lls_chunk in _merge_streams(self.executor, open_streams):
+            chunk = build_chunk(index, lls_chunk)
+            if chunk is not None:
+                yield chunk
 
 
 class Chat:
     completions: ChatCompletions
 
-    def __init__(self, llama_stack_client):
+    def __init__(self, llama_stack_client, **kwargs):
+        # kwargs are passed on to ChatCompletions
         self.lls_client = llama_stack_client
-        self.completions = ChatCompletions(self.lls_client)
+        self.completions = ChatCompletions(self.lls_client, **kwargs)
 
 
 class Models:
-    def __init__(self, llama_stack_client):
+    def __init__(self, llama_stack_client, model_catalog=None):
         self.lls_client = llama_stack_client
+        if model_catalog is None:
+            model_catalog = ModelCatalog(self.lls_client.models.list)
+        self.model_catalog = model_catalog
 
     def list(self, *_args, **_kwargs):
-        # TODO: this needs to convert response values from Llama Stack
-        # to OpenAI format
-        return self.lls_client.models.list()
+        return self.model_catalog.list()
+
+    def retrieve(self, model, *_args, **_kwargs):
+        self.model_catalog.check(model)
+        return next(m for m in self.model_catalog.models() if m.id == model)
 
 
 class OpenAIClientAdapter:
     completions: Completions
     chat: Chat
 
-    def __init__(self, llama_stack_client: LlamaStackClient):
-        self.lls_client = llama_stack_client
-        if not self.lls_client:
-            raise ValueError("A `llama_stack_client` must be provided.")
+    def __init__(
+        self,
+        llama_stack_client: "LlamaStackClient | list",
+        max_concurrency: int = 1,
+        batch_inference: bool | None = None,
+        cache: ResponseCache | None = None,
+        coalesce_requests: bool = True,
+        micro_batch_max_size: int | None = None,
+        micro_batch_max_wait: float = 0.005,
+        tool_cache_size: int = 256,
+        conversation_cache_size: int = 128,
+        guided_choice_retries: int | None = None,
+        model_cache_ttl: float | None = 60.0,
+        validate_models: bool = False,
+        adaptive_concurrency: AdaptiveLimiter | bool = False,
+        rate_limit: RateLimiter | None = None,
+        warmup: bool = False,
+    ):
+        # Inference calls can be held to a per model limit that adapts
+        # to the server's latency, queueing the rest
+        self.limiter = None
+        if adaptive_concurrency is True:
+            self.limiter = AdaptiveLimiter()
+        elif adaptive_concurrency:
+            self.limiter = adaptive_concurrency
+        self.rate_limiter = rate_limit
+        # the async limiters would be released before their calls ran
+        if isinstance(self.limiter, AsyncAdaptiveLimiter):
+            raise ValueError(
+                "`adaptive_concurrency` must be an AdaptiveLimiter, not an "
+                "AsyncAdaptiveLimiter."
+            )
+        if isinstance(rate_limit, AsyncRateLimiter):
+            raise ValueError(
+                "`rate_limit` must be a RateLimiter, not an AsyncRateLimiter."
+            )
+        # the wrappers all stand in for a LlamaStackClient
+        self.lls_client: "LlamaStackClient" = _wrap_client(
+            llama_stack_client, LlamaStackPool, self.limiter, rate_limit
+        )
+        if max_concurrency < 1:
+            raise ValueError("`max_concurrency` must be at least 1.")
+        if guided_choice_retries is not None and guided_choice_retries < 0:
+            raise ValueError("`guided_choice_retries` must not be negative.")
+
+        # With a max_concurrency of 1 every inference call is made
+        # serially on the calling thread, as it always has been
+        self._closed = False
+        executor = None
+        if max_concurrency > 1:
+            executor = ThreadPoolExecutor(
+                max_workers=max_concurrency,
+                thread_name_prefix="lls-openai-client",
+            )
 
-        self.completions = Completions(self.lls_client)
-        self.chat = Chat(self.lls_client)
-        self.models = Models(self.lls_client)
+        # Identical greedy requests in flight at the same time, from any
+        # thread, are only sent to Llama Stack once
+        single_flight = _SingleFlight() if coalesce_requests else None
+        batch_support = _BatchSupport(self.lls_client, batch_inference)
+        catalog = ModelCatalog(self.lls_client.models.list, ttl=model_cache_ttl)
+        model_catalog = catalog if validate_models else None
+
+        # The resources hold the state the adapter's methods share
+        self.completions = Completions(
+            self.lls_client,
+            executor=executor,
+            batch_inference=batch_support,
+            cache=cache,
+            single_flight=single_flight,
+            micro_batch_max_size=micro_batch_max_size,
+            micro_batch_max_wait=micro_batch_max_wait,
+            max_concurrency=max_concurrency,
+            guided_choice_retries=guided_choice_retries,
+            model_catalog=model_catalog,
+        )
+        self.chat = Chat(
+            self.lls_client,
+            executor=executor,
+            batch_inference=batch_support,
+            cache=cache,
+            single_flight=single_flight,
+            tool_registry=ToolRegistry(max_entries=tool_cache_size),
+            message_converter=_MessageConverter(conversation_cache_size),
+            guided_choice_retries=guided_choice_retries,
+            model_catalog=model_catalog,
+        )
+        self.models = Models(self.lls_client, catalog)
+
+        if warmup:
+            self.warmup()
+
+    def warmup(self, models=None, probe: bool = False):
+        # Pays the costs of the first requests up front. The model list is
+        # fetched on max_concurrency connections at once so the pool has
+        # that many open, batch inference support is detected and, with
+        # `probe`, every model in `models` (all LLMs by default) gets a
+        # one token completion to wake up its provider.
+        if self._closed:
+            raise ValueError("`warmup` can't be called after `close`.")
+        catalog = self.models.model_catalog
+        _map_ordered(
+            self.completions.executor,
+            lambda _i: catalog.refresh(),
+            range(self.max_concurrency),
+        )
+        for model_id in models or []:
+            catalog.check(model_id)
+        _ = self.completions.batch_support.enabled
+
+        if probe:
+            if models is None:
+                models = _llm_ids(self.lls_client.models.list())
+            _map_ordered(
+                self.completions.executor,
+                lambda model_id: self.lls_client.inference.completion(
+                    model_id=model_id,
+                    content=_WARMUP_PROMPT,
+                    sampling_params=_WARMUP_SAMPLING_PARAMS,
+                ),
+                models,
+            )
 
-        # Specifically disable batching when used by instructlab-sdg
-        self.server_supports_batched = False
+    @property
+    def max_concurrency(self) -> int:
+        return self.completions.max_concurrency
 
     @property
-    def base_url(self) -> httpx.URL:
+    def tools(self) -> ToolRegistry:
+        return self.chat.completions.tool_registry
+
+    def register_tools(self, tools) -> str:
+        # Converts `tools` once and returns a handle that can be passed
+        # as the `tools` of any later chat completion request
+        return self.tools.register(tools)
+
+    def unregister_tools(self, handle: str):
+        self.tools.unregister(handle)
+
+    @property
+    def server_supports_batched(self) -> bool:
+        # Tells instructlab-sdg whether to send us lists of prompts or
+        # de-batch them itself
+        return self.completions.batch_inference
+
+    @server_supports_batched.setter
+    def server_supports_batched(self, value: bool):
+        self.completions.batch_support.enabled = value
+
+    @property
+    def base_url(self) -> "httpx.URL":
         return self.lls_client.base_url
 
     def get(self, *args, **kwargs):
         return self.lls_client.get(*args, **kwargs)
+
+    def close(self):
+        self._closed = True
+        if self.completions.executor is not None:
+            self.completions.executor.shutdown(wait=True)
@@ -0,0 +1,5 @@
+class InvalidRequestError(ValueError):
+    # Raised for requests that can't be made as given, like ones for a
+    # model that doesn't exist, as opposed to failures of Llama Stack or
+    # of its output. The proxy answers these with a 400.
+    pass
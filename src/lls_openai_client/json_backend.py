@@ -0,0 +1,26 @@
+# Standard
+import json
+
+
+def _default_loads():
+    try:
+        # Third Party
+        import orjson  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return json.loads
+    return orjson.loads
+
+
+class _Backend:
+    loads = staticmethod(_default_loads())
+
+
+def set_json_loads(loads=None):
+    # Replaces the function used to parse JSON responses. It must raise
+    # a ValueError (json.JSONDecodeError is one) on invalid input. None
+    # goes back to orjson when it's installed or json otherwise.
+    _Backend.loads = staticmethod(loads or _default_loads())
+
+
+def json_loads(text):
+    return _Backend.loads(text)
@@ -0,0 +1,439 @@
+# Standard
+from collections import deque
+import functools
+import statistics
+import threading
+import time
+
+# Local
+from .pool import _hold_async_stream, _hold_stream
+
+# Inference calls whose latency says something about how loaded the
+# server is. Batches and streams take as long as their size, so they
+# only count against the limit.
+_SAMPLED_CALLS = frozenset(["completion", "chat_completion"])
+
+
+def _is_overloaded(err: Exception) -> bool:
+    # The server pushing back, rather than a problem with the request
+    if isinstance(err, TimeoutError):
+        return True
+    # Third Party
+    from llama_stack_client import (  # pylint: disable=import-outside-toplevel
+        APIStatusError,
+        APITimeoutError,
+    )
+
+    if isinstance(err, APITimeoutError):
+        return True
+    return isinstance(err, APIStatusError) and err.status_code in (429, 503, 504)
+
+
+# The weight of the newest latency in the smoothed one
+_SMOOTHING = 0.2
+# The latencies needed before they're compared at all
+_MIN_SAMPLES = 10
+
+
+class _Latencies:
+    # A call's latency varies with its prompt and how much it generates,
+    # so one slow call says little about the server. What does is the
+    # smoothed latency drifting past `tolerance` times the median of the
+    # last `window` calls, as requests start to queue up on the server.
+
+    def __init__(self, tolerance, window):
+        self.tolerance = tolerance
+        self.smoothed: float | None = None
+        self._recent: deque[float] = deque(maxlen=window)
+        self._min_samples = min(_MIN_SAMPLES, window)
+
+    def congested(self, latency) -> bool:
+        # Adds a call's latency, returning whether the server looks
+        # congested
+        if self.smoothed is None:
+            self.smoothed = latency
+        else:
+            self.smoothed += _SMOOTHING * (latency - self.smoothed)
+        congested = (
+            len(self._recent) >= self._min_samples
+            and self.smoothed > statistics.median(self._recent) * self.tolerance
+        )
+        self._recent.append(latency)
+        return congested
+
+
+class _AIMDLimit:
+    # The concurrency limit of one model. Calls that finish while the
+    # server keeps up grow the limit by one per limit's worth of calls
+    # (additive increase). Congestion (see _Latencies), or the server
+    # pushing back, multiplies it by `backoff` (multiplicative decrease),
+    # at most once per round of calls in flight.
+
+    def __init__(self, initial_limit, min_limit, max_limit, backoff, tolerance, window):
+        self.limit = float(initial_limit)
+        self.bounds = (min_limit, max_limit)
+        self.backoff = backoff
+        self.in_flight = 0
+        self.queued = 0
+        self._latencies = _Latencies(tolerance, window)
+        self._last_decrease = 0.0
+
+    def has_room(self) -> bool:
+        return self.in_flight < max(int(self.limit), 1)
+
+    def on_done(self, start, latency, overloaded):
+        min_limit, max_limit = self.bounds
+        congested = latency is not None and self._latencies.congested(latency)
+        if overloaded or congested:
+            # calls started before the last decrease saw the old limit
+            if start >= self._last_decrease:
+                self.limit = max(min_limit, self.limit * self.backoff)
+                self._last_decrease = time.monotonic()
+        elif latency is not None and self.in_flight >= int(self.limit):
+            # only grow a limit that is actually holding calls back
+            self.limit = min(max_limit, self.limit + 1 / self.limit)
+
+
+class _LimiterBase:
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        backoff: float = 0.9,
+        tolerance: float = 2.0,
+        window: int = 100,
+    ):
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError(
+                "Limits must satisfy 1 <= `min_limit` <= `initial_limit` <= "
+                "`max_limit`."
+            )
+        if not 0 < backoff < 1:
+            raise ValueError("`backoff` must be between 0 and 1.")
+        if tolerance < 1:
+            raise ValueError("`tolerance` must be at least 1.")
+        if window < 1:
+            raise ValueError("`window` must be at least 1.")
+        self._params = (initial_limit, min_limit, max_limit, backoff, tolerance, window)
+        self._limits: dict[str | None, _AIMDLimit] = {}
+
+    def _limit(self, model_id) -> _AIMDLimit:
+        limit = self._limits.get(model_id, None)
+        if limit is None:
+            limit = self._limits[model_id] = _AIMDLimit(*self._params)
+        return limit
+
+    def stats(self):
+        # The current limit, calls in flight and calls queued per model
+        return {
+            model_id: {
+                "limit": max(int(limit.limit), 1),
+                "in_flight": limit.in_flight,
+                "queued": limit.queued,
+            }
+            for model_id, limit in list(self._limits.items())
+        }
+
+    def queue_depth(self, model_id=None) -> int:
+        # Calls waiting for room, for one model or all of them
+        if model_id is not None:
+            limit = self._limits.get(model_id, None)
+            return 0 if limit is None else limit.queued
+        return sum(limit.queued for limit in list(self._limits.values()))
+
+
+class AdaptiveLimiter(_LimiterBase):
+    # Caps the inference calls in flight per model at a limit that adapts
+    # to the server's latency (see _AIMDLimit). Calls over the limit wait
+    # their turn, which is what queue_depth() and stats() report.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._condition = threading.Condition()
+
+    def acquire(self, model_id):
+        # Blocks until the model has room, returning the start time to
+        # pass to release()
+        with self._condition:
+            limit = self._limit(model_id)
+            limit.queued += 1
+            try:
+                while not limit.has_room():
+                    self._condition.wait()
+            finally:
+                limit.queued -= 1
+            limit.in_flight += 1
+        return time.monotonic()
+
+    def release(self, model_id, start, err=None, sampled=True):
+        overloaded = err is not None and _is_overloaded(err)
+        latency = time.monotonic() - start if sampled and err is None else None
+        with self._condition:
+            limit = self._limit(model_id)
+            limit.on_done(start, latency, overloaded)
+            limit.in_flight -= 1
+            self._condition.notify_all()
+
+
+class AsyncAdaptiveLimiter(_LimiterBase):
+    # The asyncio counterpart of AdaptiveLimiter
+
+    def __init__(self, *args, **kwargs):
+        # Standard
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        super().__init__(*args, **kwargs)
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, model_id):
+        async with self._condition:
+            limit = self._limit(model_id)
+            limit.queued += 1
+            try:
+                await self._condition.wait_for(limit.has_room)
+            finally:
+                limit.queued -= 1
+            limit.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, model_id, start, err=None, sampled=True):
+        overloaded = err is not None and _is_overloaded(err)
+        latency = time.monotonic() - start if sampled and err is None else None
+        async with self._condition:
+            limit = self._limit(model_id)
+            limit.on_done(start, latency, overloaded)
+            limit.in_flight -= 1
+            self._condition.notify_all()
+
+
+class _LimitedInference:
+    def __init__(self, inference, limiter):
+        self._inference = inference
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        def _limited(*args, **kwargs):
+            model_id = kwargs.get("model_id", None)
+            start = self._limiter.acquire(model_id)
+            try:
+                result = getattr(self._inference, name)(*args, **kwargs)
+            except Exception as err:
+                self._limiter.release(model_id, start, err)
+                raise
+            if kwargs.get("stream", False):
+                # a stream keeps its place until it's done
+                release = self._release_stream(model_id, start)
+                return _hold_stream(result, release)
+            self._limiter.release(model_id, start, sampled=name in _SAMPLED_CALLS)
+            return result
+
+        return _limited
+
+    def _release_stream(self, model_id, start):
+        # called with the error the stream ended with, if any
+        return functools.partial(self._limiter.release, model_id, start, sampled=False)
+
+
+class _AsyncLimitedInference(_LimitedInference):
+    def __getattr__(self, name):
+        async def _limited(*args, **kwargs):
+            model_id = kwargs.get("model_id", None)
+            start = await self._limiter.acquire(model_id)
+            try:
+                result = await getattr(self._inference, name)(*args, **kwargs)
+            except Exception as err:
+                await self._limiter.release(model_id, start, err)
+                raise
+            if kwargs.get("stream", False):
+                release = self._release_stream(model_id, start)
+                return _hold_async_stream(result, release)
+            await self._limiter.release(model_id, start, sampled=name in _SAMPLED_CALLS)
+            return result
+
+        return _limited
+
+
+class LimitedClient:
+    # Wraps a Llama Stack client (or pool) so its inference calls go
+    # through `limiter`. Everything else is passed straight through.
+
+    def __init__(self, client, limiter):
+        self.client = client
+        self.limiter = limiter
+        if isinstance(limiter, AsyncAdaptiveLimiter):
+            self.inference = _AsyncLimitedInference(client.inference, limiter)
+        else:
+            self.inference = _LimitedInference(client.inference, limiter)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def _text_length(value) -> int:
+    # The characters of text in a prompt, a message or a list of them
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_text_length(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_text_length(item) for item in value)
+    return 0
+
+
+class _TokenBucket:
+    # Refills at `rate` per second up to `capacity`. Callers reserve what
+    # they need up front and may run it into debt, waiting until it's
+    # paid back, so they're let through in order and at a steady pace.
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.available = capacity
+        self._updated_at = time.monotonic()
+
+    def refill(self, now):
+        self.available = min(
+            self.capacity, self.available + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+        return self.available
+
+    def reserve(self, amount, now) -> float:
+        self.refill(now)
+        # a call bigger than the bucket is charged in full too, so it and
+        # everyone after it wait until it's paid for
+        self.available -= amount
+        return max(0.0, -self.available / self.rate)
+
+
+class _RateLimiterBase:
+    def __init__(
+        self,
+        requests_per_second: float | None = None,
+        tokens_per_second: float | None = None,
+        burst: float = 1.0,
+        default_max_tokens: int = 256,
+        chars_per_token: float = 4.0,
+    ):
+        if requests_per_second is None and tokens_per_second is None:
+            raise ValueError(
+                "One of `requests_per_second` or `tokens_per_second` must be set."
+            )
+        for name, rate in (
+            ("requests_per_second", requests_per_second),
+            ("tokens_per_second", tokens_per_second),
+        ):
+            if rate is not None and rate <= 0:
+                raise ValueError(f"`{name}` must be positive.")
+        if burst <= 0:
+            raise ValueError("`burst` must be positive.")
+        if chars_per_token <= 0:
+            raise ValueError("`chars_per_token` must be positive.")
+        self.default_max_tokens = default_max_tokens
+        self.chars_per_token = chars_per_token
+        # `burst` is how many seconds' worth of budget can be spent at once
+        self._buckets = [
+            (key, _TokenBucket(rate, max(rate * burst, 1.0)))
+            for key, rate in (
+                ("requests", requests_per_second),
+                ("tokens", tokens_per_second),
+            )
+            if rate is not None
+        ]
+        self._lock = threading.Lock()
+
+    def estimate(self, kwargs):
+        # The generations and tokens an inference call will cost: the
+        # prompt's length in tokens plus `max_tokens` for each generation
+        batch = kwargs.get("content_batch", None)
+        if batch is None:
+            batch = kwargs.get("messages_batch", None)
+        prompt = kwargs.get("content", None)
+        if prompt is None:
+            prompt = kwargs.get("messages", None)
+        prompts = [prompt] if batch is None else batch
+        sampling_params = kwargs.get("sampling_params", None) or {}
+        max_tokens = sampling_params.get("max_tokens", None) or self.default_max_tokens
+        prompt_tokens = _text_length(prompts) / self.chars_per_token
+        return {
+            "requests": max(len(prompts), 1),
+            "tokens": prompt_tokens + max_tokens * len(prompts),
+        }
+
+    def reserve(self, kwargs) -> float:
+        # Takes what the call costs from the budget, returning how many
+        # seconds to wait before making it
+        cost = self.estimate(kwargs)
+        with self._lock:
+            now = time.monotonic()
+            return max(bucket.reserve(cost[key], now) for key, bucket in self._buckets)
+
+    def stats(self):
+        # The budget left of requests and tokens, negative while callers
+        # are waiting on it
+        with self._lock:
+            now = time.monotonic()
+            return {key: bucket.refill(now) for key, bucket in self._buckets}
+
+
+class RateLimiter(_RateLimiterBase):
+    # Holds inference calls to a budget of requests and estimated tokens
+    # per second, so bursts are spread out instead of running into the
+    # server's quota. Callers block until the budget allows their call.
+
+    def acquire(self, kwargs):
+        delay = self.reserve(kwargs)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AsyncRateLimiter(_RateLimiterBase):
+    # The asyncio counterpart of RateLimiter
+
+    async def acquire(self, kwargs):
+        # Standard
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        delay = self.reserve(kwargs)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class _RateLimitedInference:
+    def __init__(self, inference, rate_limiter):
+        self._inference = inference
+        self._rate_limiter = rate_limiter
+
+    def __getattr__(self, name):
+        def _limited(*args, **kwargs):
+            self._rate_limiter.acquire(kwargs)
+            return getattr(self._inference, name)(*args, **kwargs)
+
+        return _limited
+
+
+class _AsyncRateLimitedInference(_RateLimitedInference):
+    def __getattr__(self, name):
+        async def _limited(*args, **kwargs):
+            await self._rate_limiter.acquire(kwargs)
+            return await getattr(self._inference, name)(*args, **kwargs)
+
+        return _limited
+
+
+class RateLimitedClient:
+    # Wraps a Llama Stack client (or pool) so its inference calls wait
+    # for `rate_limiter`'s budget. Everything else is passed straight
+    # through.
+
+    def __init__(self, client, rate_limiter):
+        self.client = client
+        self.limiter = rate_limiter
+        if isinstance(rate_limiter, AsyncRateLimiter):
+            self.inference = _AsyncRateLimitedInference(client.inference, rate_limiter)
+        else:
+            self.inference = _RateLimitedInference(client.inference, rate_limiter)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,191 @@
+# Standard
+import threading
+import time
+
+# Local
+from .errors import InvalidRequestError
+
+
+def _convert_models(lls_models, created):
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from openai.types.model import Model as OpenAIModel
+
+    # Llama Stack doesn't track when models were registered, so they all
+    # get the time they were listed at
+    return [
+        OpenAIModel(
+            id=lls_model.identifier,
+            created=created,
+            object="model",
+            owned_by=getattr(lls_model, "provider_id", None) or "llama_stack",
+        )
+        for lls_model in lls_models
+    ]
+
+
+# A catalog fetched less than this many seconds ago is trusted to reject
+# unknown models, so a stream of requests for a model that doesn't exist
+# doesn't refetch it for every one of them
+_MIN_REFRESH_INTERVAL = 1.0
+
+
+def _unknown_model(model_id):
+    return InvalidRequestError(f"The model `{model_id}` does not exist.")
+
+
+class ModelCatalog:
+    # Caches the models Llama Stack knows about, converted to OpenAI
+    # models. Once the catalog is older than `ttl` seconds, callers keep
+    # getting it while a background thread fetches a fresh one. A `ttl`
+    # of 0 fetches the models on every call and None never expires them.
+
+    def __init__(self, list_models, ttl: float | None = 60.0):
+        if ttl is not None and ttl < 0:
+            raise ValueError("`ttl` must not be negative.")
+        self.list_models = list_models
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # held by whichever refresh is in progress, in the background or
+        # for check()
+        self._refresh_lock = threading.Lock()
+        self._models = None
+        self._ids: frozenset[str] = frozenset()
+        self._fetched_at = 0.0
+
+    def _is_stale(self) -> bool:
+        return self.ttl is not None and time.monotonic() - self._fetched_at >= self.ttl
+
+    def _is_recent(self) -> bool:
+        return time.monotonic() - self._fetched_at < _MIN_REFRESH_INTERVAL
+
+    def refresh(self):
+        models = _convert_models(self.list_models(), int(time.time()))
+        with self._lock:
+            self._models = models
+            self._ids = frozenset(model.id for model in models)
+            self._fetched_at = time.monotonic()
+        return models
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:  # pylint: disable=broad-exception-caught
+            # keep serving the stale catalog, the next call tries again
+            pass
+        finally:
+            self._refresh_lock.release()
+
+    def models(self):
+        if self.ttl == 0:
+            return self.refresh()
+        with self._lock:
+            models = self._models
+        if models is None:
+            return self.refresh()
+        # the background thread releases the lock once it's done
+        # pylint: disable-next=consider-using-with
+        if self._is_stale() and self._refresh_lock.acquire(blocking=False):
+            threading.Thread(
+                target=self._refresh_in_background,
+                name="lls-openai-client-models",
+                daemon=True,
+            ).start()
+        return models
+
+    def check(self, model_id):
+        # Raises a ValueError for unknown models. A model missing from
+        # the cached catalog may have been registered since it was
+        # fetched, so only a fresh catalog is trusted to reject it.
+        self.models()
+        if model_id in self._ids:
+            return
+        with self._refresh_lock:
+            # concurrent checks wait for a single refresh between them
+            if not self._is_recent():
+                self.refresh()
+        if model_id not in self._ids:
+            raise _unknown_model(model_id)
+
+    def list(self):
+        # Third Party
+        # pylint: disable=import-outside-toplevel
+        from openai.pagination import SyncPage
+        from openai.types.model import Model as OpenAIModel
+
+        return SyncPage[OpenAIModel](data=self.models(), object="list")
+
+
+class AsyncModelCatalog:
+    # The async counterpart of ModelCatalog, refreshing in a task on the
+    # event loop instead of a thread. asyncio is imported where it's used
+    # so the sync adapter doesn't pay for it.
+
+    def __init__(self, list_models, ttl: float | None = 60.0):
+        if ttl is not None and ttl < 0:
+            raise ValueError("`ttl` must not be negative.")
+        self.list_models = list_models
+        self.ttl = ttl
+        self._models = None
+        self._ids: frozenset[str] = frozenset()
+        self._fetched_at = 0.0
+        self._refresh_task = None
+
+    def _is_stale(self) -> bool:
+        return self.ttl is not None and time.monotonic() - self._fetched_at >= self.ttl
+
+    def _is_recent(self) -> bool:
+        return time.monotonic() - self._fetched_at < _MIN_REFRESH_INTERVAL
+
+    async def _fetch(self):
+        models = _convert_models(await self.list_models(), int(time.time()))
+        self._models = models
+        self._ids = frozenset(model.id for model in models)
+        self._fetched_at = time.monotonic()
+        return models
+
+    def _start_refresh(self):
+        # Standard
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        # concurrent callers share a single fetch
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._fetch())
+            # a failed background refresh keeps the stale catalog, so
+            # mark its exception as retrieved
+            self._refresh_task.add_done_callback(
+                lambda task: task.cancelled() or task.exception()
+            )
+        return self._refresh_task
+
+    async def refresh(self):
+        # Standard
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        return await asyncio.shield(self._start_refresh())
+
+    async def models(self):
+        if self._models is None or self.ttl == 0:
+            return await self.refresh()
+        if self._is_stale():
+            self._start_refresh()
+        return self._models
+
+    async def check(self, model_id):
+        # see ModelCatalog.check. Concurrent checks share a single
+        # refresh just like any other concurrent callers.
+        await self.models()
+        if model_id in self._ids:
+            return
+        if not self._is_recent():
+            await self.refresh()
+        if model_id not in self._ids:
+            raise _unknown_model(model_id)
+
+    async def list(self):
+        # Third Party
+        # pylint: disable=import-outside-toplevel
+        from openai.pagination import AsyncPage
+        from openai.types.model import Model as OpenAIModel
+
+        return AsyncPage[OpenAIModel](data=await self.models(), object="list")
@@ -0,0 +1,510 @@
+# Standard
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+import functools
+import json
+import re
+import threading
+import time
+
+# Local
+from .cache import request_cache_key
+from .errors import InvalidRequestError
+from .json_backend import json_loads
+from .tools import _convert_tools
+
+if TYPE_CHECKING:
+    # Third Party
+    from llama_stack_client.types.inference_chat_completion_params import ToolConfig
+    from llama_stack_client.types.shared_params.response_format import (
+        JsonSchemaResponseFormat,
+    )
+    from llama_stack_client.types.shared_params.sampling_params import SamplingParams
+
+# How an OpenAI request turns into Llama Stack calls, shared by the sync
+# and async adapters so they only differ in how the calls are made
+
+_BATCH_COMPLETION_ROUTE = "/v1/inference/batch-completion"
+
+
+def _is_not_implemented(err: Exception) -> bool:
+    # Library mode surfaces the provider's NotImplementedError directly,
+    # while a remote server turns it into a 501 (or a 404/405 if the
+    # server predates the route entirely). Clients older than 0.2 have no
+    # batch methods at all, which is just as unsupported.
+    if isinstance(err, (NotImplementedError, AttributeError)):
+        return True
+    # Third Party
+    from llama_stack_client import (  # pylint: disable=import-outside-toplevel
+        APIStatusError,
+    )
+
+    return isinstance(err, APIStatusError) and err.status_code in (404, 405, 501)
+
+
+def _llm_ids(lls_models):
+    return [model.identifier for model in lls_models if model.api_model_type == "llm"]
+
+
+# How long an adapter goes without batches before detecting support
+# again, after the detection itself failed
+_BATCH_DETECTION_RETRY_INTERVAL = 30.0
+
+
+class _BatchState:
+    # Whether Llama Stack can do batch inference, shared by the
+    # completions and chat completions resources of an adapter. The
+    # sync and async adapters subclass this to detect support on first
+    # use, with calls to Llama Stack.
+
+    def __init__(
+        self, lls_client, enabled=None, retry_interval=_BATCH_DETECTION_RETRY_INTERVAL
+    ):
+        self.lls_client = lls_client
+        # None means detect support on first use
+        self._enabled = enabled
+        self._unsupported: set[tuple[str, str]] = set()
+        self.retry_interval = retry_interval
+        self._detect_after = 0.0
+
+    def _should_detect(self) -> bool:
+        return self._enabled is None and time.monotonic() >= self._detect_after
+
+    def _detected(self, enabled):
+        # Until detection gets an answer, requests go without batches
+        # and it's tried again every retry_interval
+        if enabled is None:
+            self._detect_after = time.monotonic() + self.retry_interval
+        self._enabled = enabled
+        return bool(enabled)
+
+    def _may_batch(self, api, model_id) -> bool:
+        return (api, model_id) not in self._unsupported
+
+    def _failed(self, api, model_id, err):
+        # A model's provider that can't do batches is remembered so we
+        # don't try again, anything else is raised
+        if not _is_not_implemented(err):
+            raise err
+        self._unsupported.add((api, model_id))
+
+
+def _convert_request_messages(messages):
+    # Llama Stack messages and OpenAI messages are similar, but not
+    # identical. Specifically, Llama Stack expects `call_id` but
+    # OpenAi uses `tool_call_id`
+    lls_messages = []
+    for message in messages:
+        if "tool_call_id" not in message:
+            # nothing to rename, so no need for a copy either
+            lls_messages.append(message)
+            continue
+        lls_message = message.copy()
+        tool_call_id = lls_message.pop("tool_call_id", None)
+        if tool_call_id:
+            lls_message["call_id"] = tool_call_id
+        lls_messages.append(lls_message)
+    return lls_messages
+
+
+class _MessageConverter:
+    # Agents resend the whole conversation on every turn, one or two
+    # messages longer than the last. This remembers the last conversion
+    # of recent conversations, keyed by their first message, and reuses
+    # it for the leading messages that are the very same objects as last
+    # time so only the new tail gets converted. Messages modified in
+    # place between calls are not noticed, just as the OpenAI client
+    # would not notice them after sending.
+
+    def __init__(self, max_conversations: int = 128):
+        if max_conversations < 0:
+            raise ValueError("`max_conversations` must not be negative.")
+        self.max_conversations = max_conversations
+        self._conversations: OrderedDict[int, tuple[list, list]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def convert(self, messages):
+        if not messages or self.max_conversations == 0:
+            return _convert_request_messages(messages)
+
+        key = id(messages[0])
+        with self._lock:
+            conversation = self._conversations.get(key, None)
+        reused = 0
+        lls_messages = []
+        if conversation is not None:
+            sources, converted = conversation
+            for source, message in zip(sources, messages):
+                if source is not message:
+                    break
+                reused += 1
+            lls_messages = converted[:reused]
+        lls_messages += _convert_request_messages(messages[reused:])
+
+        with self._lock:
+            # holding on to the messages also keeps their ids from being
+            # reused by other objects
+            self._conversations[key] = (list(messages), lls_messages)
+            self._conversations.move_to_end(key)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        return lls_messages
+
+
+# Characters with a special meaning in both Python and JSON schema
+# (ECMA 262) regexes. re.escape() escapes more than these, and some of
+# its escapes, like "\\-", are invalid in JSON schema patterns.
+_PATTERN_SPECIAL_CHARS = frozenset("\\.^$|?*+()[]{}")
+
+
+def _escape_pattern(text):
+    return "".join(
+        f"\\{char}" if char in _PATTERN_SPECIAL_CHARS else char for char in text
+    )
+
+
+class _GuidedChoice:
+    # Everything derived from a guided_choice list, built once per list.
+    # Instances are shared between requests, so must not be modified.
+
+    def __init__(self, choices):
+        pattern_choices = "|".join(_escape_pattern(choice) for choice in choices)
+        self.response_format: JsonSchemaResponseFormat = {
+            "type": "json_schema",
+            "json_schema": {
+                "type": "string",
+                "pattern": f"^({pattern_choices})$",
+            },
+        }
+        self.regex = re.compile(f"({pattern_choices})")
+        # Decoding guided by the schema above produces either the bare
+        # choice or its JSON encoding. Mapping both to the choice lets
+        # the common case skip JSON parsing, and keeps choices that
+        # happen to be valid JSON ("1", "true") strings.
+        self.outputs = {json.dumps(choice): choice for choice in choices}
+        self.outputs.update({choice: choice for choice in choices})
+
+    def conforms(self, text) -> bool:
+        if text in self.outputs:
+            return True
+        try:
+            value = json_loads(text)
+        except ValueError:
+            return False
+        return isinstance(value, str) and self.regex.fullmatch(value) is not None
+
+    def nonconforming(self, texts):
+        # the keys of the outputs in `texts` to retry
+        return [key for key, text in texts.items() if not self.conforms(text)]
+
+    def check(self, text):
+        if not self.conforms(text):
+            raise ValueError(f"Output {text!r} is not one of the guided choices.")
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_guided_choice(choices):
+    return _GuidedChoice(choices)
+
+
+def _parse_request_guided_choice(params):
+    guided_choice = params.get("extra_body", {}).get("guided_choice", [])
+    if not guided_choice:
+        return None
+    return _compile_guided_choice(tuple(guided_choice))
+
+
+def _parse_request_response_format(params):
+    guided_choice = _parse_request_guided_choice(params)
+    if guided_choice is None:
+        return None
+    return guided_choice.response_format
+
+
+def _parse_request_sampling_params(params):
+    temperature = params.get("temperature", 1.0)
+    if temperature == 0:
+        strategy = {"type": "greedy"}
+    else:
+        top_p = params.get("top_p", 1.0)
+        strategy = {
+            "type": "top_p",
+            "temperature": temperature,
+            "top_p": top_p,
+        }
+    sampling_params: SamplingParams = {"strategy": strategy}
+
+    max_tokens = params.get("max_tokens", None)
+    if max_tokens:
+        sampling_params["max_tokens"] = max_tokens
+
+    return sampling_params
+
+
+def _parse_request_tool_config(params):
+    tool_config = None
+    tool_choice = params.get("tool_choice", None)
+    if tool_choice:
+        tool_config: ToolConfig = {"tool_choice": tool_choice}
+    return tool_config
+
+
+def _parse_request_tools(params, tool_registry=None):
+    tools = params.get("tools", None)
+    if tool_registry is not None:
+        return tool_registry.convert(tools)
+    if isinstance(tools, str):
+        raise InvalidRequestError("Tools handles need an adapter with a tool registry")
+    if tools and isinstance(tools, list):
+        return _convert_tools(tools)
+    return []
+
+
+def _is_deterministic(sampling_params) -> bool:
+    return sampling_params["strategy"]["type"] == "greedy"
+
+
+def _prompt_key(prompt):
+    # Within a request only the prompt differs between choices, so the
+    # prompt itself tells which of them are the same
+    return prompt if isinstance(prompt, str) else json.dumps(prompt)
+
+
+def _dedupe_indices(keys, indices):
+    # Returns the subset of `indices` with unique keys, plus the position
+    # in that subset whose result each of `indices` should share. Without
+    # keys (non-greedy requests) nothing is shared.
+    if keys is None:
+        return indices, list(range(len(indices)))
+    positions = {}
+    unique = []
+    shared = []
+    for i in indices:
+        position = positions.get(keys[i], None)
+        if position is None:
+            position = positions[keys[i]] = len(unique)
+            unique.append(i)
+        shared.append(position)
+    return unique, shared
+
+
+def _lookup_cached_choices(cache, keys, count):
+    choices = [None] * count
+    if cache is None or keys is None:
+        return choices
+    for i, key in enumerate(keys):
+        cached = cache.get(key)
+        if cached is not None:
+            # cached choices are shared across responses, so each one
+            # gets its own copy with the right index
+            choices[i] = cached.model_copy(update={"index": i}, deep=True)
+    return choices
+
+
+def _store_cached_choices(cache, keys, choices, indices):
+    if cache is not None and keys is not None:
+        for i in indices:
+            cache.set(keys[i], choices[i].model_copy(deep=True))
+
+
+def _completion_content_batch(params):
+    prompts = params.get("prompt", None)
+    n = params.get("n", 1)
+    if not isinstance(prompts, list):
+        prompts = [prompts]
+
+    # "n" is the number of completions to generate per prompt, and
+    # we may have multiple prompts if batching was used. The order
+    # here determines the index of each choice in the response.
+    return [prompt for _i in range(0, n) for prompt in prompts]
+
+
+def _chunked(indices, size):
+    for start in range(0, len(indices), size):
+        yield indices[start : start + size]
+
+
+class _RequestPlan:
+    # Which choices of a request are already cached, and which of the
+    # rest are unique and so need generating (see _dedupe_indices)
+
+    def __init__(self, request, count, cache=None, single_flight=None):
+        self.cache = cache
+        # Hashing the whole request only pays off with a cache to look
+        # it up in or other calls to coalesce it with
+        self.keys = None
+        if cache is not None or single_flight is not None:
+            self.keys = request.keys
+        self.choices = _lookup_cached_choices(cache, self.keys, count)
+        self.missing = [i for i, choice in enumerate(self.choices) if choice is None]
+        self.unique, self.shared = _dedupe_indices(request.dedupe_keys, self.missing)
+        self._sharing: dict[int, list[int]] | None = None
+
+    def key(self, i):
+        # the key to coalesce the call for choice `i` by, if any
+        return self.keys[i] if self.keys else None
+
+    def fill(self, unique_results, build_choice):
+        # Builds every missing choice from the result of its unique call
+        for i, position in zip(self.missing, self.shared):
+            self.choices[i] = build_choice(i, unique_results[position])
+        return self.choices
+
+    def sharing_of(self, unique_i):
+        # The missing choices sharing the result of unique choice
+        # `unique_i`, itself included
+        if self._sharing is None:
+            self._sharing = {i: [] for i in self.unique}
+            for i, position in zip(self.missing, self.shared):
+                self._sharing[self.unique[position]].append(i)
+        return self._sharing[unique_i]
+
+    def store(self, choices, indices=None):
+        # Caches the new choices, once per key: the choices sharing a
+        # unique one's result share its key too
+        _store_cached_choices(
+            self.cache, self.keys, choices, self.unique if indices is None else indices
+        )
+
+
+class _CompletionRequest:
+    # A completions request as the Llama Stack completion calls it's
+    # made of, one per prompt and choice
+
+    def __init__(self, params):
+        self.model_id = params.get("model", None)
+        self.content_batch = _completion_content_batch(params)
+        self.response_format = _parse_request_response_format(params)
+        self.guided_choice = _parse_request_guided_choice(params)
+        self.sampling_params = _parse_request_sampling_params(params)
+        # Only greedy requests are deterministic, so only their choices
+        # are shared, cached or coalesced
+        self.dedupe_keys = None
+        if _is_deterministic(self.sampling_params):
+            self.dedupe_keys = [_prompt_key(prompt) for prompt in self.content_batch]
+
+    @functools.cached_property
+    def keys(self):
+        # the keys to cache or coalesce each choice by
+        if self.dedupe_keys is None:
+            return None
+        keys: dict[str, str] = {}
+        for prompt_key, prompt in zip(self.dedupe_keys, self.content_batch):
+            if prompt_key not in keys:
+                keys[prompt_key] = request_cache_key(
+                    "completion",
+                    self.model_id,
+                    prompt,
+                    self.sampling_params,
+                    self.response_format,
+                )
+        return [keys[prompt_key] for prompt_key in self.dedupe_keys]
+
+    def params(self, i, **extra):
+        # the completion call for choice `i`
+        return {
+            "model_id": self.model_id,
+            "content": self.content_batch[i],
+            "sampling_params": self.sampling_params,
+            "response_format": self.response_format,
+            **extra,
+        }
+
+    def retries(self, guided_choice_retries):
+        # Greedy requests would only get the same output again, so their
+        # guided_choice outputs aren't retried
+        if _is_deterministic(self.sampling_params):
+            return 0
+        return guided_choice_retries
+
+    @staticmethod
+    def output_text(lls_result):
+        # the text guided_choice outputs are checked by
+        return lls_result.content
+
+    def bind(self, completion, i, **extra):
+        return functools.partial(completion, **self.params(i, **extra))
+
+    def stream_openers(self, completion):
+        # Each prompt's stream becomes the choice at the same index as it
+        # would have in a non-streaming response
+        return [
+            self.bind(completion, i, stream=True)
+            for i in range(len(self.content_batch))
+        ]
+
+    def batch_params(self, indices):
+        # a batch completion call for several choices at once
+        return {
+            "model_id": self.model_id,
+            "content_batch": [self.content_batch[i] for i in indices],
+            "sampling_params": self.sampling_params,
+            "response_format": self.response_format,
+        }
+
+
+class _ChatCompletionRequest:
+    # A chat completions request as the Llama Stack chat completion call
+    # each of its n choices is generated by
+
+    def __init__(self, params, tool_registry=None, message_converter=None):
+        self.model_id = params.get("model", None)
+        # "n" is the number of completions to generate per prompt
+        self.n = params.get("n", 1)
+        messages = params.get("messages", None)
+        if message_converter is not None:
+            messages = message_converter.convert(messages)
+        else:
+            messages = _convert_request_messages(messages)
+        self.guided_choice = _parse_request_guided_choice(params)
+        self.params = {
+            "messages": messages,
+            "sampling_params": _parse_request_sampling_params(params),
+            "response_format": _parse_request_response_format(params),
+            "tool_config": _parse_request_tool_config(params),
+            "tools": _parse_request_tools(params, tool_registry),
+        }
+        # all n choices of a greedy request are the same
+        self.dedupe_keys = None
+        if _is_deterministic(self.params["sampling_params"]):
+            self.dedupe_keys = [0] * self.n
+
+    @functools.cached_property
+    def keys(self):
+        # see _CompletionRequest.keys
+        if self.dedupe_keys is None:
+            return None
+        return [
+            request_cache_key("chat_completion", self.model_id, self.params)
+        ] * self.n
+
+    def retries(self, guided_choice_retries):
+        # see _CompletionRequest.retries
+        if _is_deterministic(self.params["sampling_params"]):
+            return 0
+        return guided_choice_retries
+
+    @staticmethod
+    def output_text(lls_result):
+        # Content that isn't plain text can't be one of the choices
+        content = lls_result.completion_message.content
+        return content if isinstance(content, str) else ""
+
+    def bind(self, chat_completion, **extra):
+        # the chat completion call each choice is generated by
+        return functools.partial(
+            chat_completion, model_id=self.model_id, **self.params, **extra
+        )
+
+    def stream_openers(self, chat_completion):
+        return [self.bind(chat_completion, stream=True)] * self.n
+
+    def batch_params(self, count):
+        # Llama Stack has no equivalent of OpenAI's n, but a batch of the
+        # same messages gets us n samples in a single request
+        params = {key: value for key, value in self.params.items() if key != "messages"}
+        return {
+            "model_id": self.model_id,
+            "messages_batch": [self.params["messages"]] * count,
+            **params,
+        }
@@ -0,0 +1,515 @@
+# Standard
+import bisect
+import functools
+import hashlib
+import inspect
+import itertools
+import json
+import math
+import threading
+import time
+
+
+def _is_backend_failure(err: Exception) -> bool:
+    # Errors that say something is wrong with the backend rather than
+    # the request: it couldn't be reached or failed with a server error.
+    # Llama Stack reports unsupported features as a 501, which isn't one.
+    if isinstance(err, (ConnectionError, TimeoutError)):
+        return True
+    # Third Party
+    from llama_stack_client import (  # pylint: disable=import-outside-toplevel
+        APIConnectionError,
+        APIStatusError,
+    )
+
+    if isinstance(err, APIConnectionError):
+        return True
+    return (
+        isinstance(err, APIStatusError)
+        and err.status_code >= 500
+        and err.status_code != 501
+    )
+
+
+def _hold_stream(stream, release):
+    # Yields from `stream`, then calls `release` with the error it ended
+    # with, if any, so a streamed call stays in flight until it's done
+    err = None
+    try:
+        yield from stream
+    except Exception as stream_err:
+        err = stream_err
+        raise
+    finally:
+        release(err)
+
+
+async def _hold_async_stream(stream, release):
+    # The asyncio counterpart of _hold_stream, where `release` may be a
+    # coroutine function
+    err = None
+    try:
+        async for item in stream:
+            yield item
+    except Exception as stream_err:
+        err = stream_err
+        raise
+    finally:
+        released = release(err)
+        if inspect.isawaitable(released):
+            await released
+
+
+def _stable_hash(value) -> int:
+    # Unlike hash(), the same in every process, so separate adapters
+    # in front of the same pool send a prefix to the same member
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class PrefixAffinity:
+    # Sends requests that start the same way to the same member, so its
+    # prefix cache can reuse their KV cache. Chat requests are keyed by
+    # their first `messages` messages, which stay the same over the turns
+    # of a conversation, and completions by the first `prefix_chars`
+    # characters of their prompt. Members are placed on a consistent hash
+    # ring, and a member with more than `load_factor` times the average
+    # load in flight passes requests on to the next one on the ring.
+
+    def __init__(
+        self,
+        messages: int = 2,
+        prefix_chars: int = 1024,
+        load_factor: float = 1.25,
+        virtual_nodes: int = 64,
+    ):
+        if messages < 1 or prefix_chars < 1 or virtual_nodes < 1:
+            raise ValueError(
+                "`messages`, `prefix_chars` and `virtual_nodes` must be at least 1."
+            )
+        if load_factor < 1:
+            raise ValueError("`load_factor` must be at least 1.")
+        self.messages = messages
+        self.prefix_chars = prefix_chars
+        self.load_factor = load_factor
+        self.virtual_nodes = virtual_nodes
+
+    def key(self, kwargs):
+        # batches are keyed by their first request
+        messages = kwargs.get("messages", None)
+        if messages is None and kwargs.get("messages_batch", None):
+            messages = kwargs["messages_batch"][0]
+        if messages:
+            return _stable_hash(messages[: self.messages])
+
+        content = kwargs.get("content", None)
+        if content is None and kwargs.get("content_batch", None):
+            content = kwargs["content_batch"][0]
+        if content is None:
+            return None
+        if isinstance(content, str):
+            content = content[: self.prefix_chars]
+        return _stable_hash(content)
+
+
+class _Member:
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+
+class _Ring:
+    # The consistent hash ring a PrefixAffinity places members on
+
+    def __init__(self, affinity, members):
+        self.affinity = affinity
+        self._members = members
+        self._ring = sorted(
+            (_stable_hash(f"{member.index}:{node}"), member.index)
+            for member in members
+            for node in range(affinity.virtual_nodes)
+        )
+        self._points = [point for point, _index in self._ring]
+
+    def place(self, candidates, key):
+        # The first candidate clockwise from `key` with fewer than
+        # `load_factor` times the average load in flight, as in
+        # consistent hashing with bounded loads
+        allowed = {member.index for member in candidates}
+        total = sum(member.in_flight for member in candidates) + 1
+        capacity = math.ceil(self.affinity.load_factor * total / len(candidates))
+        start = bisect.bisect(self._points, key)
+        for offset in range(len(self._ring)):
+            _point, index = self._ring[(start + offset) % len(self._ring)]
+            member = self._members[index]
+            if index in allowed and member.in_flight < capacity:
+                return member
+        return None
+
+
+class _Members:
+    # Picks the member with the fewest requests in flight, taking turns
+    # between equally loaded ones. `max_failures` backend failures in a
+    # row eject a member for `ejection_time` seconds. With an `affinity`,
+    # requests are placed by their prefix instead. Only a lock is held
+    # while choosing, so sync and async pools share this.
+
+    def __init__(
+        self, clients, model_clients, max_failures, ejection_time, affinity=None
+    ):
+        if max_failures < 1:
+            raise ValueError("`max_failures` must be at least 1.")
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+
+        members = {}
+
+        def _members(group):
+            return [
+                members.setdefault(id(client), _Member(client, len(members)))
+                for client in group
+            ]
+
+        # the members for each model, and under None for all the others
+        self._groups = {None: _members(clients)}
+        self._groups.update(
+            (model_id, _members(group))
+            for model_id, group in (model_clients or {}).items()
+            if group
+        )
+        self.all = list(members.values())
+        if not self.all:
+            raise ValueError("A pool needs at least one Llama Stack client.")
+        if not self._groups[None]:
+            self._groups[None] = self.all
+
+        if affinity is True:
+            affinity = PrefixAffinity()
+        self._ring = _Ring(affinity, self.all) if affinity else None
+
+    def acquire_for(self, kwargs) -> _Member:
+        key = None
+        if self._ring is not None:
+            key = self._ring.affinity.key(kwargs)
+        return self.acquire(kwargs.get("model_id", None), key)
+
+    def acquire(self, model_id=None, key=None) -> _Member:
+        members = self._groups.get(model_id, self._groups[None])
+        with self._lock:
+            now = time.monotonic()
+            # when every member is ejected, keep trying them all rather
+            # than failing every request
+            healthy = [member for member in members if member.ejected_until <= now]
+            candidates = healthy or members
+            member = None
+            if key is not None and len(candidates) > 1:
+                member = self._ring.place(candidates, key)
+            if member is None:
+                start = next(self._turn) % len(candidates)
+                rotated = candidates[start:] + candidates[:start]
+                member = min(rotated, key=lambda member: member.in_flight)
+            member.in_flight += 1
+        return member
+
+    def available(self):
+        # the members that aren't ejected, or all of them if every one is
+        now = time.monotonic()
+        with self._lock:
+            healthy = [member for member in self.all if member.ejected_until <= now]
+        return healthy or list(self.all)
+
+    def release(self, member, err=None):
+        failed = err is not None and _is_backend_failure(err)
+        with self._lock:
+            member.in_flight -= 1
+            self._record(member, failed)
+
+    def record(self, member, err=None):
+        # the outcome of a call made to `member` outside of acquire()
+        failed = err is not None and _is_backend_failure(err)
+        with self._lock:
+            self._record(member, failed)
+
+    def _record(self, member, failed):
+        if not failed:
+            member.failures = 0
+            return
+        member.failures += 1
+        if member.failures >= self.max_failures:
+            member.failures = 0
+            member.ejected_until = time.monotonic() + self.ejection_time
+
+    def record_health(self, member, healthy):
+        with self._lock:
+            if healthy:
+                member.failures = 0
+                member.ejected_until = 0.0
+            else:
+                member.failures = 0
+                member.ejected_until = time.monotonic() + self.ejection_time
+
+    def healthy(self):
+        now = time.monotonic()
+        with self._lock:
+            return [member.ejected_until <= now for member in self.all]
+
+
+def _unique_models(model_lists):
+    # models served by several members are listed once
+    seen = set()
+    models = []
+    for lls_models in model_lists:
+        for lls_model in lls_models:
+            if lls_model.identifier not in seen:
+                seen.add(lls_model.identifier)
+                models.append(lls_model)
+    return models
+
+
+def _merge_model_lists(members, listed, results):
+    # Records how the model list call to each of the `listed` members
+    # went and merges the lists of the ones that answered. Only when none
+    # did is there an error to raise.
+    model_lists = []
+    error = None
+    for member, result in zip(listed, results):
+        if isinstance(result, BaseException):
+            members.record(member, result)
+            error = result
+        else:
+            members.record(member)
+            model_lists.append(result)
+    if not model_lists and error is not None:
+        raise error
+    return _unique_models(model_lists)
+
+
+class _RoutedResource:
+    # Stands in for a resource of a Llama Stack client, like `inference`,
+    # sending each call to a member chosen by its `model_id`
+
+    def __init__(self, pool, resource):
+        self._pool = pool
+        self._resource = resource
+
+    def __getattr__(self, name):
+        def _routed(*args, **kwargs):
+            return self._pool.route(self._resource, name, args, kwargs)
+
+        return _routed
+
+
+class _PooledModels:
+    # Lists the models of every member that isn't ejected, so one being
+    # down doesn't hide the models of the rest
+
+    def __init__(self, pool, members):
+        self._pool = pool
+        self._members = members
+
+    def list(self, *args, **kwargs):
+        listed = self._members.available()
+        results = []
+        for member in listed:
+            try:
+                results.append(member.client.models.list(*args, **kwargs))
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                results.append(err)
+        return _merge_model_lists(self._members, listed, results)
+
+    def __getattr__(self, name):
+        return getattr(_RoutedResource(self._pool, "models"), name)
+
+
+class LlamaStackPool:
+    # Looks like a LlamaStackClient, but spreads requests over several
+    # of them. Requests for a model in `model_clients` go to that
+    # model's clients, everything else to `clients` (or every client if
+    # there are none). Each request goes to the member with the fewest
+    # in flight, and members that keep failing are ejected for a while.
+    # With a `health_check_interval`, ejected members are also checked
+    # in the background and put back as soon as they respond. With
+    # `prefix_affinity` (True or a PrefixAffinity), requests that share
+    # a prefix go to the same member while it isn't overloaded.
+
+    def __init__(
+        self,
+        clients=(),
+        model_clients=None,
+        max_failures: int = 3,
+        ejection_time: float = 30.0,
+        health_check_interval: float | None = None,
+        prefix_affinity: PrefixAffinity | bool = False,
+    ):
+        self._members = _Members(
+            clients, model_clients, max_failures, ejection_time, prefix_affinity
+        )
+        self.inference = _RoutedResource(self, "inference")
+        self.routes = _RoutedResource(self, "routes")
+        self.models = _PooledModels(self, self._members)
+
+        self._stop = threading.Event()
+        self._health_thread = None
+        if health_check_interval is not None:
+            self._health_thread = threading.Thread(
+                target=self._check_health_periodically,
+                args=(health_check_interval,),
+                name="lls-openai-client-health",
+                daemon=True,
+            )
+            self._health_thread.start()
+
+    @property
+    def clients(self):
+        return [member.client for member in self._members.all]
+
+    @property
+    def base_url(self):
+        return self._members.all[0].client.base_url
+
+    def get(self, *args, **kwargs):
+        return self.route(None, "get", args, kwargs)
+
+    def route(self, resource, name, args, kwargs):
+        member = self._members.acquire_for(kwargs)
+        target = member.client
+        if resource is not None:
+            target = getattr(target, resource)
+        try:
+            result = getattr(target, name)(*args, **kwargs)
+        except Exception as err:
+            self._members.release(member, err)
+            raise
+        if kwargs.get("stream", False):
+            release = functools.partial(self._members.release, member)
+            return _hold_stream(result, release)
+        self._members.release(member)
+        return result
+
+    def check_health(self):
+        # Lists the models of every member, ejecting the ones that fail
+        # and putting back the ones that succeed. Returns whether each
+        # member is healthy, in the order of `clients`.
+        for member in self._members.all:
+            try:
+                member.client.models.list()
+            except Exception:  # pylint: disable=broad-exception-caught
+                self._members.record_health(member, False)
+            else:
+                self._members.record_health(member, True)
+        return self._members.healthy()
+
+    def _check_health_periodically(self, interval):
+        while not self._stop.wait(interval):
+            self.check_health()
+
+    def close(self):
+        # closes the health checks and every member client
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+        for client in self.clients:
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
+
+
+class _AsyncRoutedResource(_RoutedResource):
+    def __getattr__(self, name):
+        async def _routed(*args, **kwargs):
+            return await self._pool.route(self._resource, name, args, kwargs)
+
+        return _routed
+
+
+class _AsyncPooledModels:
+    # see _PooledModels, asking the members all at once
+
+    def __init__(self, pool, members):
+        self._pool = pool
+        self._members = members
+
+    async def list(self, *args, **kwargs):
+        # Standard
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        listed = self._members.available()
+        results = await asyncio.gather(
+            *[member.client.models.list(*args, **kwargs) for member in listed],
+            return_exceptions=True,
+        )
+        return _merge_model_lists(self._members, listed, results)
+
+    def __getattr__(self, name):
+        return getattr(_AsyncRoutedResource(self._pool, "models"), name)
+
+
+class AsyncLlamaStackPool:
+    # The async counterpart of LlamaStackPool, for AsyncLlamaStackClients.
+    # There is no background health checking, call check_health() to put
+    # ejected members back early.
+
+    def __init__(
+        self,
+        clients=(),
+        model_clients=None,
+        max_failures: int = 3,
+        ejection_time: float = 30.0,
+        prefix_affinity: PrefixAffinity | bool = False,
+    ):
+        self._members = _Members(
+            clients, model_clients, max_failures, ejection_time, prefix_affinity
+        )
+        self.inference = _AsyncRoutedResource(self, "inference")
+        self.routes = _AsyncRoutedResource(self, "routes")
+        self.models = _AsyncPooledModels(self, self._members)
+
+    @property
+    def clients(self):
+        return [member.client for member in self._members.all]
+
+    @property
+    def base_url(self):
+        return self._members.all[0].client.base_url
+
+    async def get(self, *args, **kwargs):
+        return await self.route(None, "get", args, kwargs)
+
+    async def route(self, resource, name, args, kwargs):
+        member = self._members.acquire_for(kwargs)
+        target = member.client
+        if resource is not None:
+            target = getattr(target, resource)
+        try:
+            result = await getattr(target, name)(*args, **kwargs)
+        except Exception as err:
+            self._members.release(member, err)
+            raise
+        if kwargs.get("stream", False):
+            release = functools.partial(self._members.release, member)
+            return _hold_async_stream(result, release)
+        self._members.release(member)
+        return result
+
+    async def check_health(self):
+        for member in self._members.all:
+            try:
+                await member.client.models.list()
+            except Exception:  # pylint: disable=broad-exception-caught
+                self._members.record_health(member, False)
+            else:
+                self._members.record_health(member, True)
+        return self._members.healthy()
+
+    async def close(self):
+        for client in self.clients:
+            close = getattr(client, "close", None)
+            if close is not None:
+                await close()
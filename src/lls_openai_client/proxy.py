@@ -0,0 +1,230 @@
+# Standard
+import argparse
+import contextlib
+import json
+import os
+
+try:
+    # Third Party
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, Response, StreamingResponse
+    from starlette.routing import Route
+except ImportError as err:
+    raise ImportError(
+        "The proxy needs extra dependencies, install them with "
+        "`pip install lls-openai-client[proxy]`."
+    ) from err
+
+# Local
+from .async_client_adapter import AsyncOpenAIClientAdapter
+from .cache import InMemoryCache, SQLiteCache, TieredCache
+from .errors import InvalidRequestError
+
+# How the proxy command hands its options to the app factory, which may
+# run in several worker processes
+_CONFIG_ENV = "LLS_OPENAI_PROXY_CONFIG"
+
+# Request fields the OpenAI client sends at the top level of the body
+# when given in `extra_body`, but the adapter expects in `extra_body`
+_EXTRA_BODY_FIELDS = ("guided_choice",)
+
+
+def _error_response(status_code, message, error_type):
+    return JSONResponse(
+        {"error": {"message": message, "type": error_type}},
+        status_code=status_code,
+    )
+
+
+async def _invalid_request(_request, err):
+    return _error_response(400, str(err), "invalid_request_error")
+
+
+async def _output_error(_request, err):
+    # Any other ValueError means a response couldn't be made of what
+    # Llama Stack returned, like a guided_choice output that isn't one
+    # of the choices or a response that fails validation
+    return _error_response(502, str(err), "api_error")
+
+
+async def _upstream_error(_request, err):
+    # Llama Stack's own errors keep their status code
+    status_code = getattr(err, "status_code", None) or 502
+    return _error_response(status_code, str(err), "api_error")
+
+
+def _model_response(model):
+    return Response(model.model_dump_json(), media_type="application/json")
+
+
+async def _server_sent_events(chunks):
+    async for chunk in chunks:
+        yield f"data: {chunk.model_dump_json()}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+async def _request_params(request):
+    try:
+        params = await request.json()
+    except ValueError as err:
+        raise InvalidRequestError(f"The request body is not valid JSON: {err}") from err
+    if not isinstance(params, dict):
+        raise InvalidRequestError("The request body must be a JSON object.")
+    for field in _EXTRA_BODY_FIELDS:
+        if field in params:
+            params.setdefault("extra_body", {})[field] = params.pop(field)
+    return params
+
+
+def create_app(client: AsyncOpenAIClientAdapter, warmup: bool = False):
+    # Serves the OpenAI completions, chat completions and models APIs
+    # from `client`, which is shared by every request to this process
+
+    async def _create(create, request):
+        params = await _request_params(request)
+        response = await create(**params)
+        if params.get("stream", False):
+            return StreamingResponse(
+                _server_sent_events(response), media_type="text/event-stream"
+            )
+        return _model_response(response)
+
+    async def completions(request):
+        return await _create(client.completions.create, request)
+
+    async def chat_completions(request):
+        return await _create(client.chat.completions.create, request)
+
+    async def list_models(_request):
+        page = await client.models.list()
+        return JSONResponse(
+            {"object": "list", "data": [model.model_dump() for model in page.data]}
+        )
+
+    async def retrieve_model(request):
+        return _model_response(
+            await client.models.retrieve(request.path_params["model"])
+        )
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_app):
+        if warmup:
+            await client.warmup()
+        yield
+        close = getattr(client.lls_client, "close", None)
+        if close is not None:
+            await close()
+
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from llama_stack_client import APIError
+
+    return Starlette(
+        routes=[
+            Route("/v1/completions", completions, methods=["POST"]),
+            Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+            Route("/v1/models", list_models, methods=["GET"]),
+            Route("/v1/models/{model:path}", retrieve_model, methods=["GET"]),
+        ],
+        exception_handlers={
+            InvalidRequestError: _invalid_request,
+            ValueError: _output_error,
+            APIError: _upstream_error,
+        },
+        lifespan=lifespan,
+    )
+
+
+def _create_cache(config):
+    cache = None
+    if config.get("cache_db"):
+        cache = SQLiteCache(config["cache_db"])
+    if config.get("cache_size"):
+        memory_cache = InMemoryCache(max_entries=config["cache_size"])
+        cache = memory_cache if cache is None else TieredCache(memory_cache, cache)
+    return cache
+
+
+def create_app_from_env():
+    # The app factory the proxy command runs in each worker, configured
+    # by the options it was started with
+
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    from llama_stack_client import AsyncLlamaStackClient
+
+    config = json.loads(os.environ.get(_CONFIG_ENV, "{}"))
+    lls_client = AsyncLlamaStackClient(
+        base_url=config.get("llama_stack_url", "http://localhost:8321")
+    )
+    client = AsyncOpenAIClientAdapter(
+        lls_client,
+        max_concurrency=config.get("max_concurrency", None),
+        cache=_create_cache(config),
+        validate_models=config.get("validate_models", False),
+    )
+    return create_app(client, warmup=config.get("warmup", False))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the OpenAI API on top of a Llama Stack server."
+    )
+    parser.add_argument(
+        "--llama-stack-url",
+        default=os.environ.get("LLAMA_STACK_URL", "http://localhost:8321"),
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--keep-alive",
+        type=int,
+        default=5,
+        help="seconds to keep idle client connections open",
+    )
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=0,
+        help="number of greedy responses to cache in memory per worker",
+    )
+    parser.add_argument(
+        "--cache-db",
+        default=None,
+        help="SQLite file to cache greedy responses in, shared by all workers",
+    )
+    parser.add_argument("--validate-models", action="store_true")
+    parser.add_argument("--warmup", action="store_true")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    os.environ[_CONFIG_ENV] = json.dumps(
+        {
+            "llama_stack_url": args.llama_stack_url,
+            "max_concurrency": args.max_concurrency,
+            "cache_size": args.cache_size,
+            "cache_db": args.cache_db,
+            "validate_models": args.validate_models,
+            "warmup": args.warmup,
+        }
+    )
+
+    # Third Party
+    # pylint: disable=import-outside-toplevel
+    import uvicorn
+
+    uvicorn.run(
+        "lls_openai_client.proxy:create_app_from_env",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_keep_alive=args.keep_alive,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Standard
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+import operator
+import threading
+
+# Local
+from .cache import request_cache_key
+from .errors import InvalidRequestError
+
+if TYPE_CHECKING:
+    # Third Party
+    from llama_stack_client.types.inference_chat_completion_params import Tool
+    from llama_stack_client.types.shared_params.tool_param_definition import (
+        ToolParamDefinition,
+    )
+
+
+def _convert_tools(tools):
+    lls_tools = []
+    for tool in tools:
+        tool_fn = tool.get("function", {})
+        tool_name = tool_fn.get("name", None)
+        tool_desc = tool_fn.get("description", None)
+
+        tool_params = tool_fn.get("parameters", None)
+        lls_tool_params = {}
+        if tool_params is not None:
+            tool_param_properties = tool_params.get("properties", {})
+            for tool_param_key, tool_param_value in tool_param_properties.items():
+                tool_param_def: ToolParamDefinition = {
+                    "param_type": tool_param_value.get("type", None),
+                    "description": tool_param_value.get("description", None),
+                }
+                lls_tool_params[tool_param_key] = tool_param_def
+
+        lls_tool: Tool = {
+            "tool_name": tool_name,
+            "description": tool_desc,
+            "parameters": lls_tool_params,
+        }
+        lls_tools.append(lls_tool)
+    return lls_tools
+
+
+class ToolRegistry:
+    # Converts OpenAI tool definitions to Llama Stack ones, remembering
+    # the result. Agents send the same tools on every turn, so the
+    # conversions of the last `max_entries` tool lists are kept, keyed by
+    # their first tool and reused for lists of the very same tool
+    # objects. Fingerprinting their content instead would cost more than
+    # converting them. As with conversations, tools modified in place
+    # between calls are not noticed.
+    #
+    # Tool lists can also be registered up front and then passed to
+    # chat.completions.create by the returned handle in place of the
+    # list itself. Registered tools are never evicted.
+
+    def __init__(self, max_entries: int = 256):
+        if max_entries < 0:
+            raise ValueError("`max_entries` must not be negative.")
+        self.max_entries = max_entries
+        self._converted: OrderedDict[int, tuple[list, list]] = OrderedDict()
+        self._registered: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._converted)
+
+    def register(self, tools) -> str:
+        handle = f"tools-{request_cache_key(tools)}"
+        lls_tools = _convert_tools(tools)
+        with self._lock:
+            self._registered[handle] = lls_tools
+        return handle
+
+    def unregister(self, handle: str):
+        with self._lock:
+            self._registered.pop(handle, None)
+
+    def convert(self, tools):
+        if isinstance(tools, str):
+            with self._lock:
+                lls_tools = self._registered.get(tools, None)
+            if lls_tools is None:
+                raise InvalidRequestError(f"Unknown tools handle '{tools}'")
+            # callers are free to modify the list they get back
+            return list(lls_tools)
+        if not tools or not isinstance(tools, list):
+            return []
+        if self.max_entries == 0:
+            return _convert_tools(tools)
+
+        key = id(tools[0])
+        with self._lock:
+            converted = self._converted.get(key, None)
+            if converted is not None:
+                sources, lls_tools = converted
+                if len(sources) == len(tools) and all(
+                    map(operator.is_, sources, tools)
+                ):
+                    self._converted.move_to_end(key)
+                    return list(lls_tools)
+
+        lls_tools = _convert_tools(tools)
+        with self._lock:
+            # holding on to the tools also keeps their ids from being
+            # reused by other objects
+            self._converted[key] = (list(tools), lls_tools)
+            self._converted.move_to_end(key)
+            while len(self._converted) > self.max_entries:
+                self._converted.popitem(last=False)
+        return list(lls_tools)
@@ -3,10 +3,13 @@
 # pylint: disable=redefined-outer-name, unused-argument
 
 # Standard
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 import json
 
 # Third Party
+from openai.types.chat.chat_completion_chunk import (
+    ChatCompletionChunk as OpenAIChatCompletionChunk,
+)
 import httpx
 import pytest
 
@@ -725,3 +728,46 @@ def test_chat_completion_responses_non_streaming(
         response_json = response_choice.model_dump(exclude_unset=True)
         expected_json = client_response["choices"][i]
         assert response_json == expected_json
+
+
+def test_chat_completion_streaming(client, mock_model_id):
+    async def mock_stream():
+        deltas = [
+            ("mock", None),
+            (" streamed", None),
+            (" response", None),
+            ("", "stop"),
+        ]
+        for text, finish_reason in deltas:
+            yield OpenAIChatCompletionChunk(
+                id="chunk",
+                choices=[
+                    {
+                        "index": 0,
+                        "delta": {"content": text},
+                        "finish_reason": finish_reason,
+                    }
+                ],
+                created=1,
+                model=mock_model_id,
+                object="chat.completion.chunk",
+            )
+
+    with patch(
+        "openai.resources.chat.completions.AsyncCompletions.create",
+        new_callable=AsyncMock,
+    ) as mock_create:
+        mock_create.return_value = mock_stream()
+        chunks = list(
+            client.chat.completions.create(
+                model=mock_model_id,
+                messages=[{"role": "user", "content": "user prompt"}],
+                stream=True,
+            )
+        )
+
+    assert mock_create.call_args.kwargs["stream"]
+    assert chunks[0].choices[0].delta.role == "assistant"
+    content = "".join(chunk.choices[0].delta.content or "" for chunk in chunks)
+    assert content == "mock streamed response"
+    assert chunks[-1].choices[0].finish_reason == "stop"
@@ -7,8 +7,14 @@ from unittest.mock import AsyncMock, patch
 
 # Third Party
 from llama_stack.apis.inference import CompletionResponse
+from openai.types.completion import Completion as OpenAICompletion
+from openai.types.completion_choice import CompletionChoice as OpenAICompletionChoice
 import pytest
 
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.client_adapter import OpenAIClientAdapter
+
 
 @pytest.fixture
 def mock_completion_response():
@@ -169,3 +175,57 @@ def test_temperature_0(client, mock_model_id, mock_openai_completion):
     mock_openai_completion.assert_called()
     call_kwargs = mock_openai_completion.call_args.kwargs
     assert call_kwargs["temperature"] == 0
+
+
+def test_batch_prompts_concurrent(lls_client, mock_model_id, mock_openai_completion):
+    client = OpenAIClientAdapter(lls_client, max_concurrency=4)
+    kwargs = {
+        "model": mock_model_id,
+        "prompt": ["test1", "test2"],
+        "max_tokens": 1,
+        "n": 3,
+    }
+    response = client.completions.create(**kwargs)
+    client.close()
+    assert len(mock_openai_completion.call_args_list) == 6
+    for i, choice in enumerate(response.choices):
+        assert choice.index == i
+
+
+def test_server_supports_batched(client):
+    # remote::vllm registers the batch route but does not implement it
+    assert not client.server_supports_batched
+
+
+def test_completion_streaming(client, mock_model_id):
+    async def mock_stream():
+        deltas = [("mock", None), (" streamed", None), (" response", "stop")]
+        for text, finish_reason in deltas:
+            yield OpenAICompletion.construct(
+                id="chunk",
+                choices=[
+                    OpenAICompletionChoice.construct(
+                        index=0, text=text, finish_reason=finish_reason, logprobs=None
+                    )
+                ],
+                created=1,
+                model=mock_model_id,
+                object="text_completion",
+            )
+
+    with patch(
+        "openai.resources.completions.AsyncCompletions.create", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.return_value = mock_stream()
+        chunks = list(
+            client.completions.create(
+                model=mock_model_id,
+                prompt="foo bar",
+                stream=True,
+            )
+        )
+
+    assert mock_create.call_args.kwargs["stream"]
+    content = "".join(chunk.choices[0].text for chunk in chunks)
+    assert content == "mock streamed response"
+    assert chunks[-1].choices[0].finish_reason == "stop"
@@ -0,0 +1,370 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# pylint: disable=duplicate-code,protected-access
+
+# Standard
+from types import SimpleNamespace
+import asyncio
+
+# Third Party
+import pytest
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.async_client_adapter import AsyncOpenAIClientAdapter
+from lls_openai_client.limits import AdaptiveLimiter, RateLimiter
+
+
+class FakeAsyncInference:
+    def __init__(self, supports_batch=False):
+        self.supports_batch = supports_batch
+        self.calls = []
+        self.batch_calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _track(self, kwargs):
+        self.calls.append(kwargs)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+    async def completion(self, **kwargs):
+        await self._track(kwargs)
+        if kwargs.get("stream", False):
+            return self._completion_stream(kwargs["content"])
+        return SimpleNamespace(
+            content=f"echo: {kwargs['content']}",
+            stop_reason="end_of_turn",
+        )
+
+    async def _completion_stream(self, content):
+        for token in ["echo:", " ", content]:
+            await asyncio.sleep(0.001)
+            yield SimpleNamespace(delta=token, stop_reason=None)
+        yield SimpleNamespace(delta="", stop_reason="end_of_turn")
+
+    async def chat_completion(self, **kwargs):
+        await self._track(kwargs)
+        if kwargs.get("stream", False):
+            return self._chat_completion_stream()
+        return SimpleNamespace(
+            completion_message=SimpleNamespace(
+                role="assistant",
+                content="hello",
+                tool_calls=[],
+                stop_reason="end_of_turn",
+            )
+        )
+
+    async def _chat_completion_stream(self):
+        for event_type, text in [
+            ("start", ""),
+            ("progress", "hel"),
+            ("progress", "lo"),
+        ]:
+            await asyncio.sleep(0.001)
+            yield SimpleNamespace(
+                event=SimpleNamespace(
+                    event_type=event_type,
+                    delta=SimpleNamespace(type="text", text=text),
+                )
+            )
+        yield SimpleNamespace(
+            event=SimpleNamespace(
+                event_type="complete",
+                delta=SimpleNamespace(type="text", text=""),
+                stop_reason="end_of_turn",
+            )
+        )
+
+    async def batch_completion(self, **kwargs):
+        if not self.supports_batch:
+            raise NotImplementedError("no batches here")
+        self.batch_calls.append(kwargs)
+        return SimpleNamespace(
+            batch=[
+                SimpleNamespace(content=f"echo: {content}", stop_reason="end_of_turn")
+                for content in kwargs["content_batch"]
+            ]
+        )
+
+    async def batch_chat_completion(self, **kwargs):
+        if not self.supports_batch:
+            raise NotImplementedError("no batches here")
+        self.batch_calls.append(kwargs)
+        return SimpleNamespace(
+            batch=[
+                await self.chat_completion(**kwargs)
+                for _messages in kwargs["messages_batch"]
+            ]
+        )
+
+
+def make_fake_async_lls_client(**kwargs):
+    async def list_models():
+        return [SimpleNamespace(identifier="foo", api_model_type="llm")]
+
+    async def list_routes():
+        return [SimpleNamespace(route="/v1/inference/batch-completion")]
+
+    return SimpleNamespace(
+        inference=FakeAsyncInference(**kwargs),
+        models=SimpleNamespace(list=list_models),
+        routes=SimpleNamespace(list=list_routes),
+    )
+
+
+def test_async_completions():
+    lls_client = make_fake_async_lls_client()
+    client = AsyncOpenAIClientAdapter(lls_client)
+    prompts = ["a", "b", "c"]
+    response = asyncio.run(client.completions.create(model="foo", prompt=prompts, n=2))
+
+    assert len(lls_client.inference.calls) == 6
+    # without a max_concurrency everything is sent at once
+    assert lls_client.inference.max_in_flight == 6
+    for i, choice in enumerate(response.choices):
+        assert choice.index == i
+        assert choice.text == f"echo: {prompts[i % len(prompts)]}"
+
+
+def test_async_chat_completions_bounded():
+    lls_client = make_fake_async_lls_client()
+    client = AsyncOpenAIClientAdapter(lls_client, max_concurrency=2)
+    response = asyncio.run(
+        client.chat.completions.create(
+            model="foo",
+            messages=[{"role": "user", "content": "hi"}],
+            n=5,
+        )
+    )
+
+    assert lls_client.inference.max_in_flight == 2
+    assert [choice.index for choice in response.choices] == list(range(5))
+    assert response.choices[0].message.content == "hello"
+    assert response.choices[0].finish_reason == "stop"
+
+
+def test_async_chat_completions_greedy_n():
+    lls_client = make_fake_async_lls_client()
+    client = AsyncOpenAIClientAdapter(lls_client)
+    response = asyncio.run(
+        client.chat.completions.create(
+            model="foo",
+            messages=[{"role": "user", "content": "hi"}],
+            n=3,
+            temperature=0,
+        )
+    )
+
+    assert len(lls_client.inference.calls) == 1
+    assert [choice.index for choice in response.choices] == [0, 1, 2]
+
+
+def test_async_chat_completions_batch_n():
+    lls_client = make_fake_async_lls_client(supports_batch=True)
+    client = AsyncOpenAIClientAdapter(lls_client)
+    messages = [{"role": "user", "content": "hi"}]
+    response = asyncio.run(
+        client.chat.completions.create(model="foo", messages=messages, n=3)
+    )
+
+    # one (empty) detection probe, then a single batch for the request
+    assert len(lls_client.inference.batch_calls) == 2
+    assert lls_client.inference.batch_calls[-1]["messages_batch"] == [messages] * 3
+    assert [choice.index for choice in response.choices] == [0, 1, 2]
+
+
+def test_async_models_list():
+    client = AsyncOpenAIClientAdapter(make_fake_async_lls_client())
+    models = asyncio.run(client.models.list())
+    assert models.data[0].id == "foo"
+
+
+def test_async_warmup():
+    lls_client = make_fake_async_lls_client()
+    client = AsyncOpenAIClientAdapter(lls_client, max_concurrency=2)
+    asyncio.run(client.warmup(probe=True))
+
+    assert len(lls_client.inference.calls) == 1
+    assert lls_client.inference.calls[0]["model_id"] == "foo"
+    assert lls_client.inference.calls[0]["sampling_params"]["max_tokens"] == 1
+
+
+def test_async_batch_inference_detection_retries():
+    lls_client = make_fake_async_lls_client()
+    list_routes = lls_client.routes.list
+
+    async def unreachable():
+        raise ConnectionError("connection refused")
+
+    lls_client.routes.list = unreachable
+    client = AsyncOpenAIClientAdapter(lls_client)
+    assert not asyncio.run(client.server_supports_batched())
+    assert client.completions.batch_support._enabled is None
+
+    lls_client.routes.list = list_routes
+    client.completions.batch_support._detect_after = 0.0
+    # the fake provider doesn't implement batches, which is remembered
+    assert not asyncio.run(client.server_supports_batched())
+    assert client.completions.batch_support._enabled is False
+
+
+def test_async_max_concurrency_must_be_positive():
+    with pytest.raises(ValueError):
+        AsyncOpenAIClientAdapter(make_fake_async_lls_client(), max_concurrency=0)
+
+
+def test_async_limiters_must_be_async():
+    with pytest.raises(ValueError):
+        AsyncOpenAIClientAdapter(
+            make_fake_async_lls_client(), adaptive_concurrency=AdaptiveLimiter()
+        )
+    with pytest.raises(ValueError):
+        AsyncOpenAIClientAdapter(
+            make_fake_async_lls_client(),
+            rate_limit=RateLimiter(requests_per_second=1),
+        )
+
+
+def test_async_completions_stream():
+    client = AsyncOpenAIClientAdapter(make_fake_async_lls_client())
+    prompts = ["a", "b"]
+
+    async def _collect():
+        stream = await client.completions.create(
+            model="foo", prompt=prompts, n=2, stream=True
+        )
+        return [chunk async for chunk in stream]
+
+    texts = {}
+    for chunk in asyncio.run(_collect()):
+        choice = chunk.choices[0]
+        texts[choice.index] = texts.get(choice.index, "") + choice.text
+    assert texts == {i: f"echo: {prompts[i % len(prompts)]}" for i in range(4)}
+
+
+def test_async_chat_completions_stream():
+    client = AsyncOpenAIClientAdapter(make_fake_async_lls_client())
+
+    async def _collect():
+        stream = await client.chat.completions.create(
+            model="foo",
+            messages=[{"role": "user", "content": "hi"}],
+            stream=True,
+            n=2,
+        )
+        return [chunk async for chunk in stream]
+
+    chunks = asyncio.run(_collect())
+    indices = [chunk.choices[0].index for chunk in chunks]
+    # the n streams are consumed at the same time, so their chunks
+    # arrive interleaved rather than one stream after the other
+    assert indices != sorted(indices)
+    for i in range(2):
+        choices = [c.choices[0] for c in chunks if c.choices[0].index == i]
+        assert choices[0].delta.role == "assistant"
+        assert "".join(c.delta.content or "" for c in choices) == "hello"
+        assert choices[-1].finish_reason == "stop"
+
+
+def test_async_guided_choice_retries():
+    lls_client = make_fake_async_lls_client()
+    client = AsyncOpenAIClientAdapter(lls_client, guided_choice_retries=2)
+    kwargs = {
+        "model": "foo",
+        "prompt": ["a", "b"],
+        "extra_body": {"guided_choice": ["yes", "no"]},
+    }
+    with pytest.raises(ValueError):
+        asyncio.run(client.completions.create(**kwargs))
+    # both prompts get both of their retries
+    assert len(lls_client.inference.calls) == 6
+
+    with pytest.raises(ValueError):
+        asyncio.run(client.completions.create(**kwargs, temperature=0))
+    # but greedy ones would only get the same output again
+    assert len(lls_client.inference.calls) == 8
+
+
+def test_async_chat_guided_choice_retries():
+    lls_client = make_fake_async_lls_client()
+    client = AsyncOpenAIClientAdapter(lls_client, guided_choice_retries=1)
+    kwargs = {
+        "model": "foo",
+        "messages": [{"role": "user", "content": "hi"}],
+        "n": 2,
+        "extra_body": {"guided_choice": ["yes", "no"]},
+    }
+    with pytest.raises(ValueError):
+        asyncio.run(client.chat.completions.create(**kwargs))
+    # both choices get their retry
+    assert len(lls_client.inference.calls) == 4
+
+    with pytest.raises(ValueError):
+        asyncio.run(client.chat.completions.create(**kwargs, temperature=0))
+    assert len(lls_client.inference.calls) == 5
+
+
+def test_async_coalesce_requests():
+    lls_client = make_fake_async_lls_client()
+    client = AsyncOpenAIClientAdapter(lls_client)
+    kwargs = {
+        "model": "foo",
+        "messages": [{"role": "user", "content": "hi"}],
+        "temperature": 0,
+    }
+
+    async def _create_all():
+        return await asyncio.gather(
+            *[client.chat.completions.create(**kwargs) for _ in range(5)]
+        )
+
+    responses = asyncio.run(_create_all())
+    assert len(lls_client.inference.calls) == 1
+    assert len({response.id for response in responses}) == 5
+
+
+def test_async_completions_create_iter():
+    lls_client = make_fake_async_lls_client()
+    client = AsyncOpenAIClientAdapter(lls_client, max_concurrency=2)
+
+    async def _collect():
+        iterator = client.completions.create_iter(model="foo", prompt=["a", "b"], n=2)
+        return [choice async for choice in iterator]
+
+    choices = asyncio.run(_collect())
+    assert lls_client.inference.max_in_flight == 2
+    assert sorted((choice.index, choice.text) for choice in choices) == [
+        (0, "echo: a"),
+        (1, "echo: b"),
+        (2, "echo: a"),
+        (3, "echo: b"),
+    ]
+
+
+def test_async_completions_create_iter_batches():
+    lls_client = make_fake_async_lls_client(supports_batch=True)
+    client = AsyncOpenAIClientAdapter(lls_client, max_concurrency=2)
+    prompts = [str(i) for i in range(5)]
+
+    def _batches():
+        return [
+            call["content_batch"]
+            for call in lls_client.inference.batch_calls
+            if call["content_batch"]
+        ]
+
+    async def _collect():
+        iterator = client.completions.create_iter(model="foo", prompt=prompts)
+        first = await anext(iterator)
+        # only the first batch is sent before its choices are yielded
+        assert _batches() == [["0", "1"]]
+        return [first, *[choice async for choice in iterator]]
+
+    choices = asyncio.run(_collect())
+    assert _batches() == [["0", "1"], ["2", "3"]]
+    assert len(lls_client.inference.calls) == 1
+    assert [choice.index for choice in choices] == list(range(5))
@@ -0,0 +1,76 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+# Third Party
+import pytest
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.batching import MicroBatcher
+
+
+class RecordingExecute:
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, group_key, items):
+        with self._lock:
+            self.batches.append((group_key, list(items)))
+        return [f"{group_key}:{item}" for item in items]
+
+
+def test_batches_up_to_max_size():
+    execute = RecordingExecute()
+    # a long window, so batches are only flushed by filling up
+    batcher = MicroBatcher(execute, max_batch_size=4, max_wait=10)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: batcher.submit("g", i), range(8)))
+
+    assert results == [f"g:{i}" for i in range(8)]
+    assert sorted(len(items) for _, items in execute.batches) == [4, 4]
+
+
+def test_flushes_after_max_wait():
+    execute = RecordingExecute()
+    batcher = MicroBatcher(execute, max_batch_size=100, max_wait=0.01)
+    assert batcher.submit("g", "a") == "g:a"
+    assert execute.batches == [("g", ["a"])]
+
+
+def test_groups_are_batched_separately():
+    execute = RecordingExecute()
+    batcher = MicroBatcher(execute, max_batch_size=100, max_wait=0.2)
+
+    def _submit(i):
+        return batcher.submit(f"g{i % 2}", i)
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(_submit, range(6)))
+
+    assert results == [f"g{i % 2}:{i}" for i in range(6)]
+    assert len(execute.batches) == 2
+    for group_key, items in execute.batches:
+        assert all(f"g{item % 2}" == group_key for item in items)
+
+
+def test_errors_reach_every_caller():
+    def execute(_group_key, _items):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(execute, max_batch_size=3, max_wait=10)
+
+    def _submit(i):
+        with pytest.raises(RuntimeError):
+            batcher.submit("g", i)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(_submit, range(3)))
+
+
+def test_max_batch_size_must_be_positive():
+    with pytest.raises(ValueError):
+        MicroBatcher(RecordingExecute(), max_batch_size=0)
@@ -0,0 +1,188 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import sqlite3
+import threading
+import time
+
+# Third Party
+from openai.types.chat.chat_completion import Choice as ChatChoice
+from openai.types.completion_choice import CompletionChoice
+import pytest
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.cache import (
+    FIFOPolicy,
+    InMemoryCache,
+    SQLiteCache,
+    TieredCache,
+    request_cache_key,
+)
+
+
+def make_choice(text):
+    return CompletionChoice(index=0, text=text, finish_reason="stop")
+
+
+def test_request_cache_key_is_canonical():
+    key1 = request_cache_key("completion", "foo", {"a": 1, "b": [1, 2]})
+    key2 = request_cache_key("completion", "foo", {"b": [1, 2], "a": 1})
+    key3 = request_cache_key("completion", "foo", {"b": [2, 1], "a": 1})
+    assert key1 == key2
+    assert key1 != key3
+
+
+def test_lru_eviction():
+    cache = InMemoryCache(max_entries=2)
+    cache.set("a", make_choice("a"))
+    cache.set("b", make_choice("b"))
+    # reading "a" makes "b" the least recently used
+    assert cache.get("a").text == "a"
+    cache.set("c", make_choice("c"))
+    assert cache.get("b") is None
+    assert cache.get("a").text == "a"
+    assert cache.get("c").text == "c"
+    assert len(cache) == 2
+
+
+def test_fifo_eviction():
+    cache = InMemoryCache(max_entries=2, policy=FIFOPolicy())
+    cache.set("a", make_choice("a"))
+    cache.set("b", make_choice("b"))
+    cache.get("a")
+    cache.set("c", make_choice("c"))
+    assert cache.get("a") is None
+    assert cache.get("b").text == "b"
+
+
+def test_max_bytes():
+    entry_size = len(make_choice("x" * 100).model_dump_json())
+    cache = InMemoryCache(max_bytes=entry_size * 2)
+    for key in ["a", "b", "c"]:
+        cache.set(key, make_choice("x" * 100))
+    assert len(cache) == 2
+    assert cache.get("a") is None
+
+    # entries bigger than the whole cache are never stored
+    cache.set("big", make_choice("x" * 1000))
+    assert cache.get("big") is None
+
+
+def test_clear():
+    cache = InMemoryCache()
+    cache.set("a", make_choice("a"))
+    cache.clear()
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_max_entries_must_be_positive():
+    with pytest.raises(ValueError):
+        InMemoryCache(max_entries=0)
+
+
+def test_sqlite_cache_persists(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = SQLiteCache(path)
+    cache.set("a", make_choice("a"))
+    chat_choice = ChatChoice(
+        index=0,
+        message={"role": "assistant", "content": "hi"},
+        finish_reason="stop",
+    )
+    cache.set("chat", chat_choice)
+    cache.close()
+
+    # a new instance, as after a restart, sees everything written before
+    reopened = SQLiteCache(path)
+    assert reopened.get("a") == make_choice("a")
+    assert reopened.get("chat") == chat_choice
+    assert reopened.get("missing") is None
+
+
+def test_sqlite_cache_ttl(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.db", ttl=60)
+    cache.set("a", make_choice("a"))
+    assert cache.get("a") is not None
+    with patch("time.time", return_value=time.time() + 120):
+        assert cache.get("a") is None
+        cache.compact()
+    assert cache.get("a") is None
+
+
+def test_sqlite_cache_compaction(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.db", max_entries=3, compact_every=5)
+    for i in range(5):
+        cache.set(str(i), make_choice(str(i)))
+        time.sleep(0.001)
+    # the fifth write triggered a compaction down to the newest three
+    assert [cache.get(str(i)) is not None for i in range(5)] == [
+        False,
+        False,
+        True,
+        True,
+        True,
+    ]
+
+
+def test_sqlite_cache_max_bytes(tmp_path):
+    entry_size = len(make_choice("x").model_dump_json())
+    cache = SQLiteCache(tmp_path / "cache.db", max_bytes=entry_size * 2)
+    for key in ["a", "b", "c"]:
+        cache.set(key, make_choice("x"))
+        time.sleep(0.001)
+    cache.compact()
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.get("c") is not None
+
+
+def test_sqlite_cache_concurrent_writers(tmp_path):
+    path = tmp_path / "cache.db"
+    caches = [SQLiteCache(path), SQLiteCache(path)]
+
+    def _write(i):
+        caches[i % 2].set(str(i), make_choice(str(i)))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(_write, range(100)))
+    for i in range(100):
+        assert caches[(i + 1) % 2].get(str(i)).text == str(i)
+
+
+def test_sqlite_cache_close_closes_every_thread(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.db")
+    cache.set("a", make_choice("a"))
+    thread = threading.Thread(target=cache.get, args=("a",))
+    thread.start()
+    thread.join()
+    connections = list(cache._connections)
+    assert len(connections) == 2
+
+    cache.close()
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    # and the cache opens new connections when used again
+    assert cache.get("a").text == "a"
+
+
+def test_sqlite_cache_rejects_unknown_types(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.db")
+    with pytest.raises(TypeError):
+        cache.set("a", "not a choice")
+
+
+def test_tiered_cache(tmp_path):
+    slow = SQLiteCache(tmp_path / "cache.db")
+    slow.set("a", make_choice("a"))
+    fast = InMemoryCache()
+    cache = TieredCache(fast, slow)
+    assert cache.get("a").text == "a"
+    assert fast.get("a").text == "a"
+
+    cache.set("b", make_choice("b"))
+    assert slow.get("b").text == "b"
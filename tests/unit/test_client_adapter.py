@@ -1,8 +1,145 @@
 # SPDX-License-Identifier: Apache-2.0
 
+# pylint: disable=redefined-outer-name, protected-access
+
+# Standard
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import threading
+import time
+
+# Third Party
+import pytest
+
 # First Party
 # pylint: disable=import-error
-from lls_openai_client.client_adapter import _parse_request_response_format
+from lls_openai_client.cache import InMemoryCache, request_cache_key
+from lls_openai_client.client_adapter import (
+    OpenAIClientAdapter,
+    _build_completion_choice,
+)
+from lls_openai_client.limits import (
+    AdaptiveLimiter,
+    AsyncAdaptiveLimiter,
+    AsyncRateLimiter,
+    RateLimiter,
+)
+from lls_openai_client.planning import (
+    _convert_request_messages,
+    _MessageConverter,
+    _parse_request_guided_choice,
+    _parse_request_response_format,
+)
+
+
+class FakeInference:
+    # what chat_completion streams, set by the tests that stream
+    chat_stream: list = []
+
+    def __init__(self, delay=0.0, supports_batch=False):
+        self.delay = delay
+        self.supports_batch = supports_batch
+        self.calls = []
+        self.batch_calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _track(self, kwargs):
+        with self._lock:
+            self.calls.append(kwargs)
+            call_number = len(self.calls)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return call_number
+
+    def completion(self, **kwargs):
+        self._track(kwargs)
+        if kwargs.get("stream", False):
+            return self._completion_stream(kwargs["content"])
+        return SimpleNamespace(
+            content=f"echo: {kwargs['content']}",
+            stop_reason="end_of_turn",
+        )
+
+    def _completion_stream(self, content):
+        for token in ["echo:", " ", content]:
+            time.sleep(self.delay)
+            yield SimpleNamespace(delta=token, stop_reason=None)
+        yield SimpleNamespace(delta="", stop_reason="out_of_tokens")
+
+    def chat_completion(self, **kwargs):
+        call_number = self._track(kwargs)
+        if kwargs.get("stream", False):
+            return iter(self.chat_stream)
+        return chat_response(f"reply {call_number}")
+
+    def batch_chat_completion(self, **kwargs):
+        if not self.supports_batch:
+            raise NotImplementedError("no batches here")
+        self.batch_calls.append(kwargs)
+        return SimpleNamespace(
+            batch=[
+                chat_response(f"batch reply {i}")
+                for i in range(len(kwargs["messages_batch"]))
+            ]
+        )
+
+    def batch_completion(self, **kwargs):
+        if not self.supports_batch:
+            raise NotImplementedError("no batches here")
+        self.batch_calls.append(kwargs)
+        return SimpleNamespace(
+            batch=[
+                SimpleNamespace(content=f"echo: {content}", stop_reason="end_of_turn")
+                for content in kwargs["content_batch"]
+            ]
+        )
+
+
+def chat_response(content):
+    return SimpleNamespace(
+        completion_message=SimpleNamespace(
+            role="assistant",
+            content=content,
+            tool_calls=[],
+            stop_reason="end_of_turn",
+        )
+    )
+
+
+def stream_chunk(event_type, delta, stop_reason=None):
+    return SimpleNamespace(
+        event=SimpleNamespace(
+            event_type=event_type,
+            delta=delta,
+            stop_reason=stop_reason,
+        )
+    )
+
+
+def text_delta(text):
+    return SimpleNamespace(type="text", text=text)
+
+
+def make_fake_lls_client(**kwargs):
+    return SimpleNamespace(
+        inference=FakeInference(**kwargs),
+        models=SimpleNamespace(
+            list=lambda: [SimpleNamespace(identifier="foo", api_model_type="llm")]
+        ),
+        routes=SimpleNamespace(
+            list=lambda: [SimpleNamespace(route="/v1/inference/batch-completion")]
+        ),
+    )
+
+
+@pytest.fixture
+def fake_lls_client():
+    return make_fake_lls_client(delay=0.01)
 
 
 def test_guided_choice_response_format():
@@ -12,3 +149,791 @@ def test_guided_choice_response_format():
     assert response_fmt["type"] == "json_schema"
     for choice in choices:
         assert choice in response_fmt["json_schema"]["pattern"]
+
+
+def test_guided_choice_skips_json_parsing(monkeypatch):
+    params = {"extra_body": {"guided_choice": ["yes", "no", "1"]}}
+    response_fmt = _parse_request_response_format(params)
+    guided_choice = _parse_request_guided_choice(params)
+
+    def fail_loads(_text):
+        raise AssertionError("guided choice output should not be parsed")
+
+    monkeypatch.setattr("lls_openai_client.client_adapter.json_loads", fail_loads)
+    for content, expected in [('"yes"', "yes"), ("no", "no"), ("1", "1")]:
+        lls_result = SimpleNamespace(content=content, stop_reason="end_of_turn")
+        choice = _build_completion_choice(0, lls_result, response_fmt, guided_choice)
+        assert choice["text"] == expected
+
+
+def test_guided_choice_unknown_output_is_parsed():
+    params = {"extra_body": {"guided_choice": ["yes", "no"]}}
+    response_fmt = _parse_request_response_format(params)
+    guided_choice = _parse_request_guided_choice(params)
+
+    lls_result = SimpleNamespace(content='"maybe"', stop_reason="end_of_turn")
+    choice = _build_completion_choice(0, lls_result, response_fmt, guided_choice)
+    assert choice["text"] == "maybe"
+
+    lls_result = SimpleNamespace(content="maybe", stop_reason="end_of_turn")
+    choice = _build_completion_choice(0, lls_result, response_fmt, guided_choice)
+    assert choice["text"] == "maybe"
+
+
+def test_guided_choice_compiled_once():
+    params = {"extra_body": {"guided_choice": ["yes", "no"]}}
+    first = _parse_request_guided_choice(params)
+    second = _parse_request_guided_choice(
+        {"extra_body": {"guided_choice": ["yes", "no"]}}
+    )
+    assert first is second
+    assert _parse_request_response_format(params) is first.response_format
+    assert _parse_request_guided_choice({}) is None
+
+
+def test_guided_choice_pattern_escaped():
+    params = {"extra_body": {"guided_choice": ["a.b", "c|d", "x-y"]}}
+    guided_choice = _parse_request_guided_choice(params)
+    pattern = guided_choice.response_format["json_schema"]["pattern"]
+    assert pattern == r"^(a\.b|c\|d|x-y)$"
+    assert guided_choice.conforms("a.b")
+    assert guided_choice.conforms('"c|d"')
+    assert not guided_choice.conforms("axb")
+    assert not guided_choice.conforms("c")
+
+
+def test_guided_choice_retries(fake_lls_client):
+    outputs = iter(["maybe", '"perhaps"', '"no"'])
+    fake_lls_client.inference.completion = lambda **_kwargs: SimpleNamespace(
+        content=next(outputs), stop_reason="end_of_turn"
+    )
+    client = OpenAIClientAdapter(fake_lls_client, guided_choice_retries=2)
+    response = client.completions.create(
+        model="foo", prompt="bar", extra_body={"guided_choice": ["yes", "no"]}
+    )
+    assert response.choices[0].text == "no"
+
+
+def test_guided_choice_retries_exhausted(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, guided_choice_retries=1)
+    with pytest.raises(ValueError):
+        client.completions.create(
+            model="foo", prompt="bar", extra_body={"guided_choice": ["yes", "no"]}
+        )
+    assert len(fake_lls_client.inference.calls) == 2
+
+    with pytest.raises(ValueError):
+        OpenAIClientAdapter(fake_lls_client, guided_choice_retries=-1)
+
+
+def test_guided_choice_greedy_not_retried(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, guided_choice_retries=2)
+    with pytest.raises(ValueError):
+        client.completions.create(
+            model="foo",
+            prompt="bar",
+            temperature=0,
+            extra_body={"guided_choice": ["yes", "no"]},
+        )
+    # a greedy request would only get the same output again
+    assert len(fake_lls_client.inference.calls) == 1
+
+
+def test_guided_choice_retries_concurrent():
+    lls_client = make_fake_lls_client()
+    inference = lls_client.inference
+    retried = threading.Barrier(3, timeout=5)
+
+    def _completion(**kwargs):
+        if inference._track(kwargs) <= 3:
+            return SimpleNamespace(content="maybe", stop_reason="end_of_turn")
+        # only returns once all three retries are in flight together
+        retried.wait()
+        return SimpleNamespace(content="yes", stop_reason="end_of_turn")
+
+    inference.completion = _completion
+    client = OpenAIClientAdapter(lls_client, max_concurrency=3, guided_choice_retries=1)
+    response = client.completions.create(
+        model="foo",
+        prompt=["a", "b", "c"],
+        extra_body={"guided_choice": ["yes", "no"]},
+    )
+    client.close()
+    assert [choice.text for choice in response.choices] == ["yes"] * 3
+    assert len(inference.calls) == 6
+
+
+def test_chat_guided_choice_retries(fake_lls_client):
+    outputs = iter(["maybe", "no", '"yes"'])
+    fake_lls_client.inference.chat_completion = lambda **_kwargs: chat_response(
+        next(outputs)
+    )
+    client = OpenAIClientAdapter(fake_lls_client, guided_choice_retries=1)
+    kwargs = {
+        "model": "foo",
+        "messages": [{"role": "user", "content": "hi"}],
+        "n": 2,
+        "extra_body": {"guided_choice": ["yes", "no"]},
+    }
+    response = client.chat.completions.create(**kwargs)
+    # only the first choice is retried
+    assert [choice.message.content for choice in response.choices] == [
+        '"yes"',
+        "no",
+    ]
+
+    fake_lls_client.inference.chat_completion = lambda **_kwargs: chat_response("maybe")
+    with pytest.raises(ValueError):
+        client.chat.completions.create(**kwargs)
+
+
+def test_models_list(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client)
+    models = client.models.list()
+    assert [model.id for model in models] == ["foo"]
+    assert client.models.retrieve("foo").id == "foo"
+
+
+def test_validate_models(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, validate_models=True)
+    client.completions.create(model="foo", prompt="bar")
+    with pytest.raises(ValueError):
+        client.completions.create(model="unknown", prompt="bar")
+    with pytest.raises(ValueError):
+        client.chat.completions.create(
+            model="unknown", messages=[{"role": "user", "content": "hi"}]
+        )
+    assert len(fake_lls_client.inference.calls) == 1
+
+
+def test_warmup(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, max_concurrency=4)
+    client.warmup(probe=True)
+
+    calls = fake_lls_client.inference.calls
+    assert len(calls) == 1
+    assert calls[0]["model_id"] == "foo"
+    assert calls[0]["sampling_params"]["max_tokens"] == 1
+    # batch support was detected up front
+    assert client.completions.batch_support._enabled is False
+
+    with pytest.raises(ValueError, match="does not exist"):
+        client.warmup(models=["unknown"])
+
+    client.close()
+    with pytest.raises(ValueError, match="after `close`"):
+        client.warmup()
+
+
+def test_warmup_on_construct(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, warmup=True)
+    assert client.completions.batch_support._enabled is False
+    assert not fake_lls_client.inference.calls
+
+
+def test_adapter_wraps_client_list():
+    lls_clients = [make_fake_lls_client(delay=0.01) for _ in range(2)]
+    client = OpenAIClientAdapter(lls_clients, max_concurrency=4)
+    response = client.completions.create(
+        model="foo", prompt=[f"prompt{i}" for i in range(8)]
+    )
+    client.close()
+
+    assert len(response.choices) == 8
+    assert [len(lls_client.inference.calls) for lls_client in lls_clients] == [4, 4]
+
+
+def test_adaptive_concurrency(fake_lls_client):
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=2)
+    client = OpenAIClientAdapter(
+        fake_lls_client, max_concurrency=8, adaptive_concurrency=limiter
+    )
+    response = client.completions.create(model="foo", prompt=["a", "b", "c"], n=2)
+    client.close()
+
+    assert len(response.choices) == 6
+    assert fake_lls_client.inference.max_in_flight <= 2
+    assert client.limiter.stats()["foo"]["in_flight"] == 0
+
+
+def test_rate_limit(fake_lls_client):
+    rate_limiter = RateLimiter(requests_per_second=100, burst=0.02)
+    client = OpenAIClientAdapter(fake_lls_client, rate_limit=rate_limiter)
+    start = time.monotonic()
+    response = client.completions.create(model="foo", prompt=["a", "b"], n=2)
+
+    assert len(response.choices) == 4
+    # two calls wait on the budget of 100 a second
+    assert time.monotonic() - start >= 0.015
+    assert client.rate_limiter is rate_limiter
+
+
+def test_limiters_must_be_sync(fake_lls_client):
+    with pytest.raises(ValueError):
+        OpenAIClientAdapter(
+            fake_lls_client, adaptive_concurrency=AsyncAdaptiveLimiter()
+        )
+    with pytest.raises(ValueError):
+        OpenAIClientAdapter(
+            fake_lls_client, rate_limit=AsyncRateLimiter(requests_per_second=1)
+        )
+
+
+def test_max_concurrency_must_be_positive(fake_lls_client):
+    with pytest.raises(ValueError):
+        OpenAIClientAdapter(fake_lls_client, max_concurrency=0)
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+def test_completions_choice_order(fake_lls_client, max_concurrency):
+    client = OpenAIClientAdapter(fake_lls_client, max_concurrency=max_concurrency)
+    prompts = [f"prompt{i}" for i in range(8)]
+    response = client.completions.create(model="foo", prompt=prompts, n=3)
+    client.close()
+
+    assert len(response.choices) == 24
+    for i, choice in enumerate(response.choices):
+        assert choice.index == i
+        assert choice.text == f"echo: {prompts[i % len(prompts)]}"
+    assert fake_lls_client.inference.max_in_flight <= max_concurrency
+
+
+def test_completions_concurrent_fan_out(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, max_concurrency=4)
+    client.completions.create(model="foo", prompt=["a", "b", "c", "d"], n=2)
+    client.close()
+    assert fake_lls_client.inference.max_in_flight > 1
+
+
+def test_completions_batch_inference():
+    lls_client = make_fake_lls_client(supports_batch=True)
+    client = OpenAIClientAdapter(lls_client)
+    assert client.server_supports_batched
+
+    prompts = ["a", "b", "c"]
+    response = client.completions.create(model="foo", prompt=prompts, n=2)
+    # one (empty) detection probe, then a single batch for the request
+    assert len(lls_client.inference.batch_calls) == 2
+    assert lls_client.inference.batch_calls[-1]["content_batch"] == prompts * 2
+    assert not lls_client.inference.calls
+    for i, choice in enumerate(response.choices):
+        assert choice.index == i
+        assert choice.text == f"echo: {prompts[i % len(prompts)]}"
+
+
+def test_completions_batch_inference_unsupported(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client)
+    assert not client.server_supports_batched
+
+    response = client.completions.create(model="foo", prompt=["a", "b"])
+    assert len(fake_lls_client.inference.calls) == 2
+    assert [choice.text for choice in response.choices] == ["echo: a", "echo: b"]
+
+
+def test_batch_inference_detection_retries():
+    lls_client = make_fake_lls_client(supports_batch=True)
+    list_routes = lls_client.routes.list
+
+    def unreachable():
+        raise ConnectionError("connection refused")
+
+    lls_client.routes.list = unreachable
+    client = OpenAIClientAdapter(lls_client)
+    # a failed detection isn't remembered as no support
+    assert not client.server_supports_batched
+    assert client.completions.batch_support._enabled is None
+
+    lls_client.routes.list = list_routes
+    client.completions.batch_support._detect_after = 0.0
+    assert client.server_supports_batched
+
+
+def test_completions_batch_inference_fallback(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, batch_inference=True)
+    client.completions.create(model="foo", prompt=["a", "b"])
+    client.completions.create(model="foo", prompt=["a", "b"])
+    assert len(fake_lls_client.inference.calls) == 4
+    assert not client.completions._supports_batch("foo")
+
+
+def test_batch_inference_missing_from_client(fake_lls_client):
+    # llama-stack-client before 0.2 has no batch methods
+    inference = fake_lls_client.inference
+    fake_lls_client.inference = SimpleNamespace(completion=inference.completion)
+    assert not OpenAIClientAdapter(fake_lls_client).server_supports_batched
+
+    client = OpenAIClientAdapter(fake_lls_client, batch_inference=True)
+    response = client.completions.create(model="foo", prompt=["a", "b"])
+    assert len(inference.calls) == 2
+    assert [choice.text for choice in response.choices] == ["echo: a", "echo: b"]
+    assert not client.completions._supports_batch("foo")
+
+
+def test_chat_completions_stream(fake_lls_client):
+    fake_lls_client.inference.chat_stream = [
+        stream_chunk("start", text_delta("")),
+        stream_chunk("progress", text_delta("Hello")),
+        stream_chunk("progress", text_delta(" world")),
+        stream_chunk("complete", text_delta(""), stop_reason="end_of_turn"),
+    ]
+    client = OpenAIClientAdapter(fake_lls_client)
+    chunks = list(
+        client.chat.completions.create(
+            model="foo",
+            messages=[{"role": "user", "content": "hi"}],
+            stream=True,
+            n=2,
+        )
+    )
+
+    assert len(fake_lls_client.inference.calls) == 2
+    assert len({chunk.id for chunk in chunks}) == 1
+    for i in range(2):
+        choices = [c.choices[0] for c in chunks if c.choices[0].index == i]
+        assert choices[0].delta.role == "assistant"
+        assert "".join(c.delta.content or "" for c in choices) == "Hello world"
+        assert choices[-1].finish_reason == "stop"
+        assert all(c.finish_reason is None for c in choices[:-1])
+
+
+def test_chat_completions_stream_tool_calls(fake_lls_client):
+    tool_call = SimpleNamespace(
+        call_id="call_1",
+        tool_name="get_price",
+        arguments_json='{"item": "apple"}',
+    )
+    fake_lls_client.inference.chat_stream = [
+        stream_chunk("start", text_delta("")),
+        stream_chunk(
+            "progress",
+            SimpleNamespace(
+                type="tool_call", parse_status="in_progress", tool_call="get_"
+            ),
+        ),
+        stream_chunk(
+            "progress",
+            SimpleNamespace(
+                type="tool_call", parse_status="succeeded", tool_call=tool_call
+            ),
+        ),
+        stream_chunk("complete", text_delta(""), stop_reason="end_of_message"),
+    ]
+    client = OpenAIClientAdapter(fake_lls_client)
+    chunks = list(
+        client.chat.completions.create(
+            model="foo",
+            messages=[{"role": "user", "content": "Call the get_price function"}],
+            stream=True,
+        )
+    )
+
+    tool_calls = [
+        tc for chunk in chunks for tc in chunk.choices[0].delta.tool_calls or []
+    ]
+    assert len(tool_calls) == 1
+    assert tool_calls[0].index == 0
+    assert tool_calls[0].id == "call_1"
+    assert tool_calls[0].function.name == "get_price"
+    assert tool_calls[0].function.arguments == '{"item": "apple"}'
+    assert chunks[-1].choices[0].finish_reason == "tool_calls"
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+def test_completions_stream(fake_lls_client, max_concurrency):
+    client = OpenAIClientAdapter(fake_lls_client, max_concurrency=max_concurrency)
+    prompts = ["a", "b", "c"]
+    chunks = list(
+        client.completions.create(model="foo", prompt=prompts, n=2, stream=True)
+    )
+    client.close()
+
+    assert len({chunk.id for chunk in chunks}) == 1
+    texts = {}
+    finish_reasons = {}
+    for chunk in chunks:
+        choice = chunk.choices[0]
+        texts[choice.index] = texts.get(choice.index, "") + choice.text
+        if choice.finish_reason:
+            finish_reasons[choice.index] = choice.finish_reason
+    assert texts == {i: f"echo: {prompts[i % len(prompts)]}" for i in range(6)}
+    assert finish_reasons == {i: "length" for i in range(6)}
+    if max_concurrency > 1:
+        # streams for different choices were interleaved
+        indices = [chunk.choices[0].index for chunk in chunks]
+        assert indices != sorted(indices)
+
+
+def test_completions_stream_error(fake_lls_client):
+    def broken_completion(**_kwargs):
+        raise RuntimeError("boom")
+
+    fake_lls_client.inference.completion = broken_completion
+    client = OpenAIClientAdapter(fake_lls_client, max_concurrency=2)
+    with pytest.raises(RuntimeError):
+        list(client.completions.create(model="foo", prompt=["a", "b"], stream=True))
+    client.close()
+
+
+def test_completions_cache(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, cache=InMemoryCache())
+    kwargs = {"model": "foo", "prompt": ["a", "b"], "temperature": 0}
+    response1 = client.completions.create(**kwargs)
+    response2 = client.completions.create(**kwargs)
+    response3 = client.completions.create(model="foo", prompt=["b", "c"], temperature=0)
+
+    # only "c" was not seen before
+    assert len(fake_lls_client.inference.calls) == 3
+    assert response1.id != response2.id
+    assert response1.choices == response2.choices
+    assert [choice.index for choice in response3.choices] == [0, 1]
+    assert [choice.text for choice in response3.choices] == ["echo: b", "echo: c"]
+
+
+def test_cache_stores_each_key_once(fake_lls_client):
+    class CountingCache(InMemoryCache):
+        def __init__(self):
+            super().__init__()
+            self.sets = 0
+
+        def set(self, key, value):
+            self.sets += 1
+            super().set(key, value)
+
+    cache = CountingCache()
+    client = OpenAIClientAdapter(fake_lls_client, cache=cache)
+    client.completions.create(model="foo", prompt=["a", "b", "a"], n=2, temperature=0)
+    assert cache.sets == 2
+    list(client.completions.create_iter(model="foo", prompt=["c", "c"], temperature=0))
+    assert cache.sets == 3
+    client.chat.completions.create(
+        model="foo", messages=[{"role": "user", "content": "hi"}], n=8, temperature=0
+    )
+    assert cache.sets == 4
+
+
+def test_completions_cache_skips_sampling(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, cache=InMemoryCache())
+    client.completions.create(model="foo", prompt="a", temperature=0.7)
+    client.completions.create(model="foo", prompt="a", temperature=0.7)
+    assert len(fake_lls_client.inference.calls) == 2
+
+
+def test_chat_completions_cache(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, cache=InMemoryCache())
+    kwargs = {
+        "model": "foo",
+        "messages": [{"role": "user", "content": "hi"}],
+        "temperature": 0,
+    }
+    response1 = client.chat.completions.create(**kwargs)
+    response2 = client.chat.completions.create(**kwargs)
+    client.chat.completions.create(
+        **kwargs, tools=[{"type": "function", "function": {"name": "foo"}}]
+    )
+
+    assert len(fake_lls_client.inference.calls) == 2
+    assert response1.id != response2.id
+    assert response2.choices[0].message.content == "reply 1"
+
+    # callers modifying a response don't affect the cache
+    response2.choices[0].message.content = "changed"
+    response4 = client.chat.completions.create(**kwargs)
+    assert response4.choices[0].message.content == "reply 1"
+
+
+@pytest.mark.parametrize(
+    "temperature,coalesce_requests,expected_calls",
+    [(0, True, 1), (0, False, 8), (0.7, True, 8)],
+)
+def test_completions_coalesce_requests(temperature, coalesce_requests, expected_calls):
+    lls_client = make_fake_lls_client(delay=0.2)
+    client = OpenAIClientAdapter(lls_client, coalesce_requests=coalesce_requests)
+
+    def _create(_i):
+        return client.completions.create(
+            model="foo", prompt="same prompt", temperature=temperature
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(_create, range(8)))
+
+    assert len(lls_client.inference.calls) == expected_calls
+    assert all(r.choices[0].text == "echo: same prompt" for r in responses)
+    assert len({r.id for r in responses}) == 8
+
+
+def test_coalesced_requests_share_errors():
+    lls_client = make_fake_lls_client()
+    calls = []
+
+    def broken_completion(**kwargs):
+        calls.append(kwargs)
+        time.sleep(0.2)
+        raise RuntimeError("boom")
+
+    lls_client.inference.completion = broken_completion
+    client = OpenAIClientAdapter(lls_client)
+
+    def _create(_i):
+        with pytest.raises(RuntimeError):
+            client.completions.create(model="foo", prompt="same", temperature=0)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_create, range(4)))
+    assert len(calls) == 1
+
+    # a failed call is not remembered
+    with pytest.raises(RuntimeError):
+        client.completions.create(model="foo", prompt="same", temperature=0)
+    assert len(calls) == 2
+
+
+def test_completions_micro_batching():
+    lls_client = make_fake_lls_client(supports_batch=True)
+    client = OpenAIClientAdapter(
+        lls_client, micro_batch_max_size=8, micro_batch_max_wait=10
+    )
+
+    def _create(i):
+        return client.completions.create(model="foo", prompt=f"prompt{i}")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(_create, range(8)))
+
+    # the detection probe, then all eight callers in a single batch
+    assert len(lls_client.inference.batch_calls) == 2
+    assert len(lls_client.inference.batch_calls[-1]["content_batch"]) == 8
+    assert not lls_client.inference.calls
+    for i, response in enumerate(responses):
+        assert response.choices[0].text == f"echo: prompt{i}"
+
+
+def test_completions_micro_batching_without_batch_inference(fake_lls_client):
+    client = OpenAIClientAdapter(
+        fake_lls_client, micro_batch_max_size=8, micro_batch_max_wait=10
+    )
+    # no batch support, so requests are sent right away instead of
+    # waiting for a batch to fill
+    response = client.completions.create(model="foo", prompt="a")
+    assert response.choices[0].text == "echo: a"
+    assert len(fake_lls_client.inference.calls) == 1
+
+
+def test_completions_dedupe_greedy_prompts(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client)
+    prompts = ["a", "b", "a", "c", "b"]
+    response = client.completions.create(
+        model="foo", prompt=prompts, n=2, temperature=0
+    )
+
+    assert sorted(call["content"] for call in fake_lls_client.inference.calls) == [
+        "a",
+        "b",
+        "c",
+    ]
+    assert len(response.choices) == 10
+    for i, choice in enumerate(response.choices):
+        assert choice.index == i
+        assert choice.text == f"echo: {prompts[i % len(prompts)]}"
+
+
+def test_completions_dedupe_batch_inference():
+    lls_client = make_fake_lls_client(supports_batch=True)
+    client = OpenAIClientAdapter(lls_client)
+    response = client.completions.create(
+        model="foo", prompt=["a", "b", "a", "b"], temperature=0
+    )
+    assert lls_client.inference.batch_calls[-1]["content_batch"] == ["a", "b"]
+    assert [c.text for c in response.choices] == ["echo: a", "echo: b"] * 2
+
+
+def test_greedy_requests_only_hashed_when_needed(fake_lls_client, monkeypatch):
+    hashed = []
+
+    def tracking_key(*args):
+        hashed.append(args)
+        return request_cache_key(*args)
+
+    monkeypatch.setattr("lls_openai_client.planning.request_cache_key", tracking_key)
+    messages = [{"role": "user", "content": "hi"}]
+    client = OpenAIClientAdapter(fake_lls_client, coalesce_requests=False)
+    client.completions.create(model="foo", prompt=["a", "a"], temperature=0)
+    client.chat.completions.create(model="foo", messages=messages, temperature=0)
+    # without a cache or coalescing there's nothing to use the keys for
+    assert not hashed
+
+    client = OpenAIClientAdapter(fake_lls_client, cache=InMemoryCache())
+    client.completions.create(model="foo", prompt=["a", "a"], temperature=0)
+    client.chat.completions.create(model="foo", messages=messages, temperature=0)
+    # one key per unique prompt, and one per chat request
+    assert len(hashed) == 2
+
+
+def test_completions_no_dedupe_when_sampling(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client)
+    client.completions.create(model="foo", prompt=["a", "a"], temperature=0.7)
+    assert len(fake_lls_client.inference.calls) == 2
+
+
+def test_chat_completions_concurrent_n(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, max_concurrency=4)
+    response = client.chat.completions.create(
+        model="foo", messages=[{"role": "user", "content": "hi"}], n=8
+    )
+    client.close()
+
+    assert len(fake_lls_client.inference.calls) == 8
+    assert fake_lls_client.inference.max_in_flight == 4
+    assert [choice.index for choice in response.choices] == list(range(8))
+    assert len({choice.message.content for choice in response.choices}) == 8
+
+
+def test_chat_completions_greedy_n(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client)
+    response = client.chat.completions.create(
+        model="foo",
+        messages=[{"role": "user", "content": "hi"}],
+        n=3,
+        temperature=0,
+    )
+    assert len(fake_lls_client.inference.calls) == 1
+    assert [choice.index for choice in response.choices] == [0, 1, 2]
+    assert {choice.message.content for choice in response.choices} == {"reply 1"}
+
+
+def test_chat_completions_batch_n():
+    lls_client = make_fake_lls_client(supports_batch=True)
+    client = OpenAIClientAdapter(lls_client)
+    messages = [{"role": "user", "content": "hi"}]
+    response = client.chat.completions.create(model="foo", messages=messages, n=3)
+
+    assert not lls_client.inference.calls
+    assert lls_client.inference.batch_calls[-1]["messages_batch"] == [messages] * 3
+    assert [choice.message.content for choice in response.choices] == [
+        "batch reply 0",
+        "batch reply 1",
+        "batch reply 2",
+    ]
+
+
+def test_chat_completions_registered_tools(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client)
+    tools = [{"type": "function", "function": {"name": "foo"}}]
+    handle = client.register_tools(tools)
+    messages = [{"role": "user", "content": "hi"}]
+    client.chat.completions.create(model="foo", messages=messages, tools=handle)
+    client.chat.completions.create(model="foo", messages=messages, tools=tools)
+
+    calls = fake_lls_client.inference.calls
+    assert calls[0]["tools"] == [
+        {"tool_name": "foo", "description": None, "parameters": {}}
+    ]
+    assert calls[0]["tools"] == calls[1]["tools"]
+
+
+def test_convert_request_messages():
+    user_message = {"role": "user", "content": "hi"}
+    tool_message = {"role": "tool", "content": "42", "tool_call_id": "call-1"}
+    lls_messages = _convert_request_messages([user_message, tool_message])
+    assert lls_messages[0] is user_message
+    assert lls_messages[1] == {"role": "tool", "content": "42", "call_id": "call-1"}
+    assert "tool_call_id" in tool_message
+
+
+def test_message_converter_reuses_prefix():
+    converter = _MessageConverter()
+    messages = [
+        {"role": "user", "content": "hi"},
+        {"role": "tool", "content": "42", "tool_call_id": "call-1"},
+    ]
+    lls_messages1 = converter.convert(messages)
+
+    messages.append({"role": "user", "content": "thanks"})
+    lls_messages2 = converter.convert(messages)
+    assert lls_messages2[1] is lls_messages1[1]
+    assert lls_messages2[2] is messages[2]
+    assert len(lls_messages1) == 2
+
+    # a conversation that diverges only reuses what it has in common
+    branch = messages[:1] + [{"role": "tool", "content": "7", "tool_call_id": "c"}]
+    lls_messages3 = converter.convert(branch)
+    assert lls_messages3[1] == {"role": "tool", "content": "7", "call_id": "c"}
+
+
+def test_message_converter_is_bounded():
+    converter = _MessageConverter(max_conversations=2)
+    conversations = [[{"role": "user", "content": str(i)}] for i in range(3)]
+    for messages in conversations:
+        converter.convert(messages)
+    assert len(converter._conversations) == 2
+
+
+def test_completions_create_iter(fake_lls_client):
+    inference = fake_lls_client.inference
+    completion = inference.completion
+
+    def _completion(**kwargs):
+        if kwargs["content"] == "slow":
+            time.sleep(0.1)
+        return completion(**kwargs)
+
+    inference.completion = _completion
+    client = OpenAIClientAdapter(fake_lls_client, max_concurrency=2)
+    prompts = ["slow", "a", "b", "c"]
+    choices = list(client.completions.create_iter(model="foo", prompt=prompts))
+    client.close()
+
+    # choices come back as they finish, each with its own index
+    assert [choice.index for choice in choices] == [1, 2, 3, 0]
+    assert [choice.text for choice in choices][-1] == "echo: slow"
+
+
+def test_completions_create_iter_bounds_pending(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, max_concurrency=2)
+    prompts = [str(i) for i in range(10)]
+    choices = client.completions.create_iter(model="foo", prompt=prompts)
+    first = next(choices)
+    time.sleep(0.05)
+    # nothing more is sent while the caller isn't consuming
+    assert len(fake_lls_client.inference.calls) <= 3
+
+    rest = list(choices)
+    client.close()
+    assert sorted(choice.index for choice in [first, *rest]) == list(range(10))
+
+
+def test_completions_create_iter_batches():
+    lls_client = make_fake_lls_client(supports_batch=True)
+    client = OpenAIClientAdapter(lls_client, max_concurrency=2)
+    prompts = [str(i) for i in range(5)]
+    choices = client.completions.create_iter(model="foo", prompt=prompts)
+
+    def _batches():
+        return [
+            call["content_batch"]
+            for call in lls_client.inference.batch_calls
+            if call["content_batch"]
+        ]
+
+    first = next(choices)
+    # only the first batch is sent before its choices are yielded
+    assert _batches() == [["0", "1"]]
+
+    rest = list(choices)
+    client.close()
+    # the odd prompt out is sent on its own
+    assert _batches() == [["0", "1"], ["2", "3"]]
+    assert len(lls_client.inference.calls) == 1
+    assert [choice.index for choice in [first, *rest]] == list(range(5))
+
+
+def test_completions_create_iter_greedy(fake_lls_client):
+    client = OpenAIClientAdapter(fake_lls_client, cache=InMemoryCache())
+    kwargs = {"model": "foo", "prompt": ["a", "a", "b"], "temperature": 0}
+    choices = list(client.completions.create_iter(**kwargs))
+    assert len(fake_lls_client.inference.calls) == 2
+    assert sorted(choice.index for choice in choices) == [0, 1, 2]
+
+    choices = list(client.completions.create_iter(**kwargs))
+    assert len(fake_lls_client.inference.calls) == 2
+    assert [choice.text for choice in choices] == ["echo: a", "echo: a", "echo: b"]
@@ -0,0 +1,29 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import subprocess
+import sys
+
+# Third Party
+import pytest
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "lls_openai_client.client_adapter",
+        "lls_openai_client.async_client_adapter",
+    ],
+)
+def test_import_defers_heavy_packages(module):
+    # a fresh interpreter, since this one has imported everything already
+    code = (
+        f"import sys, {module}\n"
+        "print(','.join(sorted({name.split('.')[0] for name in sys.modules})))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    loaded = set(result.stdout.strip().split(","))
+    assert "openai" not in loaded
+    assert "llama_stack_client" not in loaded
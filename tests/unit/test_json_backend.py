@@ -0,0 +1,39 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# Standard
+import json
+
+# Third Party
+import pytest
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.json_backend import json_loads, set_json_loads
+
+
+@pytest.fixture(autouse=True)
+def reset_json_loads():
+    yield
+    set_json_loads(None)
+
+
+def test_json_loads_default_backend():
+    assert json_loads('{"a": [1, 2]}') == {"a": [1, 2]}
+    with pytest.raises(ValueError):
+        json_loads("not json")
+
+
+def test_set_json_loads():
+    calls = []
+
+    def loads(text):
+        calls.append(text)
+        return json.loads(text)
+
+    set_json_loads(loads)
+    assert json_loads("[1]") == [1]
+    assert calls == ["[1]"]
+
+    set_json_loads(None)
+    assert json_loads("[2]") == [2]
+    assert calls == ["[1]"]
@@ -0,0 +1,248 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# pylint: disable=protected-access
+
+# Standard
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import asyncio
+import random
+import threading
+import time
+
+# Third Party
+import pytest
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.limits import (
+    AdaptiveLimiter,
+    AsyncAdaptiveLimiter,
+    AsyncRateLimiter,
+    LimitedClient,
+    RateLimitedClient,
+    RateLimiter,
+    _AIMDLimit,
+)
+
+
+class FakeInference:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.running = set()
+        # the most calls running at once
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def completion(self, **kwargs):
+        call = object()
+        with self._lock:
+            self.running.add(call)
+            self.peak = max(self.peak, len(self.running))
+        time.sleep(self.delay)
+        with self._lock:
+            self.running.discard(call)
+        if kwargs.get("stream", False):
+            return iter(["a", "b"])
+        return kwargs["model_id"]
+
+
+def make_limit(**kwargs):
+    params = {
+        "initial_limit": 4,
+        "min_limit": 1,
+        "max_limit": 8,
+        "backoff": 0.5,
+        "tolerance": 2.0,
+        "window": 100,
+    }
+    params.update(kwargs)
+    return _AIMDLimit(*params.values())
+
+
+def test_limited_client_caps_and_queues():
+    inference = FakeInference(delay=0.02)
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=2)
+    lls_client = LimitedClient(SimpleNamespace(inference=inference), limiter)
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(
+            executor.map(
+                lambda _i: lls_client.inference.completion(model_id="foo"), range(6)
+            )
+        )
+
+    assert results == ["foo"] * 6
+    assert inference.peak == 2
+    assert limiter.stats()["foo"] == {"limit": 2, "in_flight": 0, "queued": 0}
+
+
+def test_limits_are_per_model():
+    limiter = AdaptiveLimiter(initial_limit=1)
+    start = limiter.acquire("foo")
+    # another model isn't held back by foo's limit
+    limiter.release("bar", limiter.acquire("bar"))
+    limiter.release("foo", start)
+    assert limiter.stats()["foo"]["in_flight"] == 0
+
+
+def test_limited_client_streams_hold_their_place():
+    limiter = AdaptiveLimiter()
+    lls_client = LimitedClient(SimpleNamespace(inference=FakeInference()), limiter)
+    stream = lls_client.inference.completion(model_id="foo", stream=True)
+    assert next(stream) == "a"
+    assert limiter.stats()["foo"]["in_flight"] == 1
+    assert list(stream) == ["b"]
+    assert limiter.stats()["foo"]["in_flight"] == 0
+
+
+def test_aimd_grows_when_fast_and_busy():
+    limit = make_limit()
+    limit.in_flight = 4
+    for _ in range(4):
+        limit.on_done(time.monotonic(), 0.1, False)
+    assert 4.9 < limit.limit < 5.1
+
+    # an idle limit doesn't grow
+    limit.in_flight = 1
+    limit.on_done(time.monotonic(), 0.1, False)
+    assert 4.9 < limit.limit < 5.1
+
+
+def test_aimd_backs_off_once_per_round():
+    limit = make_limit()
+    for _ in range(10):
+        limit.on_done(time.monotonic(), 0.1, False)
+    start = time.monotonic()
+    # one slow call isn't congestion, but calls that stay slow are
+    limit.on_done(start, 0.5, False)
+    assert limit.limit == 4
+    limit.on_done(start, 0.5, False)
+    assert limit.limit == 2
+    # a call that started before the decrease doesn't decrease it again
+    limit.on_done(start, 0.5, False)
+    assert limit.limit == 2
+
+    limit.on_done(time.monotonic(), None, True)
+    assert limit.limit == 1
+    limit.on_done(time.monotonic(), None, True)
+    assert limit.limit == 1
+
+
+def test_aimd_holds_with_variable_latency():
+    # latencies that vary with the prompt and the generation, but don't
+    # grow, don't shrink a busy limit
+    rng = random.Random(0)
+    limit = make_limit()
+    for _ in range(500):
+        limit.in_flight = int(limit.limit)
+        limit.on_done(time.monotonic(), rng.uniform(0.05, 0.25), False)
+    assert limit.limit == 8
+
+
+def test_limiter_backs_off_on_timeouts():
+    limiter = AdaptiveLimiter(initial_limit=4, backoff=0.5)
+    start = limiter.acquire("foo")
+    limiter.release("foo", start, TimeoutError())
+    assert limiter.stats()["foo"]["limit"] == 2
+
+
+def test_limiter_validation():
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(initial_limit=0)
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(min_limit=4, initial_limit=2)
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(backoff=1)
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(window=0)
+
+
+def test_async_limited_client():
+    class AsyncInference:
+        def __init__(self):
+            self.in_flight = 0
+            self.max_in_flight = 0
+
+        async def completion(self, **kwargs):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return kwargs["model_id"]
+
+    inference = AsyncInference()
+
+    async def _run():
+        limiter = AsyncAdaptiveLimiter(initial_limit=2, max_limit=2)
+        lls_client = LimitedClient(SimpleNamespace(inference=inference), limiter)
+        return await asyncio.gather(
+            *[lls_client.inference.completion(model_id="foo") for _ in range(6)]
+        )
+
+    assert asyncio.run(_run()) == ["foo"] * 6
+    assert inference.max_in_flight == 2
+
+
+def test_rate_limiter_estimate():
+    limiter = RateLimiter(tokens_per_second=100, default_max_tokens=10)
+    assert limiter.estimate(
+        {"content": "a" * 40, "sampling_params": {"max_tokens": 5}}
+    ) == {"requests": 1, "tokens": 15}
+    assert limiter.estimate(
+        {"messages_batch": [[{"content": "a" * 8}], [{"content": "b" * 8}]]}
+    ) == {"requests": 2, "tokens": 24}
+
+
+def test_rate_limiter_spreads_requests():
+    inference = FakeInference()
+    limiter = RateLimiter(requests_per_second=50, burst=0.04)
+    lls_client = RateLimitedClient(SimpleNamespace(inference=inference), limiter)
+    start = time.monotonic()
+    for _ in range(6):
+        lls_client.inference.completion(model_id="foo")
+    # two go through at once, the other four at 50 per second
+    assert time.monotonic() - start >= 0.07
+    assert limiter.stats()["requests"] < 1
+
+
+def test_rate_limiter_budgets_tokens():
+    limiter = RateLimiter(tokens_per_second=1000, default_max_tokens=100)
+    # a full bucket of 1000 tokens covers the first ten calls
+    assert all(limiter.reserve({"content": ""}) == 0 for _ in range(10))
+    assert limiter.reserve({"content": ""}) == pytest.approx(0.1, abs=0.01)
+    # a call bigger than the bucket waits until it's paid for in full,
+    # and so does the next one
+    assert limiter.reserve({"content_batch": [""] * 100}) == pytest.approx(
+        10.1, abs=0.01
+    )
+    assert limiter.reserve({"content": ""}) == pytest.approx(10.2, abs=0.01)
+
+
+def test_rate_limiter_validation():
+    with pytest.raises(ValueError):
+        RateLimiter()
+    with pytest.raises(ValueError):
+        RateLimiter(requests_per_second=0)
+    with pytest.raises(ValueError):
+        RateLimiter(tokens_per_second=10, burst=0)
+
+
+def test_async_rate_limited_client():
+    calls = []
+
+    class AsyncInference:
+        async def completion(self, **kwargs):
+            calls.append(time.monotonic())
+            return kwargs["model_id"]
+
+    async def _run():
+        limiter = AsyncRateLimiter(requests_per_second=100, burst=0.01)
+        lls_client = RateLimitedClient(
+            SimpleNamespace(inference=AsyncInference()), limiter
+        )
+        return await asyncio.gather(
+            *[lls_client.inference.completion(model_id="foo") for _ in range(4)]
+        )
+
+    assert asyncio.run(_run()) == ["foo"] * 4
+    assert calls[-1] - calls[0] >= 0.025
@@ -0,0 +1,159 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# pylint: disable=protected-access
+
+# Standard
+from types import SimpleNamespace
+import asyncio
+import threading
+import time
+
+# Third Party
+import pytest
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client import models
+from lls_openai_client.models import AsyncModelCatalog, ModelCatalog
+
+
+class FakeModels:
+    def __init__(self, *identifiers):
+        self.identifiers = list(identifiers)
+        self.calls = 0
+
+    def list(self):
+        self.calls += 1
+        return [
+            SimpleNamespace(identifier=identifier, provider_id="vllm")
+            for identifier in self.identifiers
+        ]
+
+
+def test_catalog_converts_models():
+    catalog = ModelCatalog(FakeModels("foo", "bar").list)
+    page = catalog.list()
+    assert [model.id for model in page.data] == ["foo", "bar"]
+    assert page.data[0].object == "model"
+    assert page.data[0].owned_by == "vllm"
+    assert [model.id for model in page] == ["foo", "bar"]
+
+
+def test_catalog_cached_until_ttl():
+    lls_models = FakeModels("foo")
+    catalog = ModelCatalog(lls_models.list, ttl=0.05)
+    catalog.models()
+    catalog.models()
+    assert lls_models.calls == 1
+
+    lls_models.identifiers.append("bar")
+    time.sleep(0.06)
+    # the stale catalog is returned while a fresh one is fetched
+    assert [model.id for model in catalog.models()] == ["foo"]
+    deadline = time.monotonic() + 1
+    while lls_models.calls < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.01)
+    assert [model.id for model in catalog.models()] == ["foo", "bar"]
+
+
+def test_catalog_ttl_zero_always_fetches():
+    lls_models = FakeModels("foo")
+    catalog = ModelCatalog(lls_models.list, ttl=0)
+    catalog.models()
+    catalog.models()
+    assert lls_models.calls == 2
+
+    with pytest.raises(ValueError):
+        ModelCatalog(lls_models.list, ttl=-1)
+
+
+def test_catalog_check(monkeypatch):
+    monkeypatch.setattr(models, "_MIN_REFRESH_INTERVAL", 0.0)
+    lls_models = FakeModels("foo")
+    catalog = ModelCatalog(lls_models.list, ttl=None)
+    catalog.check("foo")
+    assert lls_models.calls == 1
+
+    # models registered after the catalog was fetched are found too
+    lls_models.identifiers.append("bar")
+    catalog.check("bar")
+    assert lls_models.calls == 2
+
+    with pytest.raises(ValueError):
+        catalog.check("baz")
+
+
+def test_catalog_check_refresh_interval():
+    lls_models = FakeModels("foo")
+    catalog = ModelCatalog(lls_models.list, ttl=None)
+    catalog.check("foo")
+
+    def _check_unknown():
+        with pytest.raises(ValueError):
+            catalog.check("bar")
+
+    # a catalog fetched moments ago is trusted to reject unknown models
+    threads = [threading.Thread(target=_check_unknown) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert lls_models.calls == 1
+
+    # and once it's older, concurrent checks share a single refresh
+    catalog._fetched_at -= models._MIN_REFRESH_INTERVAL
+    threads = [threading.Thread(target=_check_unknown) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert lls_models.calls == 2
+
+
+def test_async_catalog(monkeypatch):
+    monkeypatch.setattr(models, "_MIN_REFRESH_INTERVAL", 0.0)
+    lls_models = FakeModels("foo")
+
+    async def list_models():
+        return lls_models.list()
+
+    async def _run():
+        catalog = AsyncModelCatalog(list_models, ttl=None)
+        results = await asyncio.gather(catalog.models(), catalog.models())
+        page = await catalog.list()
+        await catalog.check("foo")
+        with pytest.raises(ValueError):
+            await catalog.check("bar")
+        return results, page
+
+    results, page = asyncio.run(_run())
+    assert [model.id for model in results[0]] == ["foo"]
+    assert results[0] is results[1]
+    assert [model.id for model in page.data] == ["foo"]
+    # one shared fetch, plus one more for the unknown model
+    assert lls_models.calls == 2
+
+
+def test_async_catalog_check_refresh_interval():
+    lls_models = FakeModels("foo")
+
+    async def list_models():
+        await asyncio.sleep(0.01)
+        return lls_models.list()
+
+    async def _check_unknown(catalog):
+        with pytest.raises(ValueError):
+            await catalog.check("bar")
+
+    async def _run():
+        catalog = AsyncModelCatalog(list_models, ttl=None)
+        await catalog.check("foo")
+        await asyncio.gather(*[_check_unknown(catalog) for _ in range(5)])
+        calls = lls_models.calls
+        catalog._fetched_at -= models._MIN_REFRESH_INTERVAL
+        await asyncio.gather(*[_check_unknown(catalog) for _ in range(5)])
+        return calls
+
+    assert asyncio.run(_run()) == 1
+    assert lls_models.calls == 2
@@ -0,0 +1,241 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# pylint: disable=protected-access
+
+# Standard
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import asyncio
+import threading
+import time
+
+# Third Party
+import pytest
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.pool import AsyncLlamaStackPool, LlamaStackPool, PrefixAffinity
+
+
+class FakeBackend:
+    def __init__(self, name, delay=0.0, models=("foo",)):
+        self.name = name
+        self.delay = delay
+        self.down = False
+        self.model_ids = list(models)
+        # calls, in_flight and max_in_flight
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def inference(self):
+        return SimpleNamespace(completion=self.completion)
+
+    @property
+    def models(self):
+        return SimpleNamespace(list=self.list_models)
+
+    def completion(self, **kwargs):
+        with self._lock:
+            self.counts["calls"] += 1
+            self.counts["in_flight"] += 1
+            self.counts["max_in_flight"] = max(
+                self.counts["max_in_flight"], self.counts["in_flight"]
+            )
+        try:
+            time.sleep(self.delay)
+            if self.down:
+                raise ConnectionError(f"{self.name} is down")
+            if kwargs.get("stream", False):
+                return iter([self.name])
+            return self.name
+        finally:
+            with self._lock:
+                self.counts["in_flight"] -= 1
+
+    def list_models(self):
+        if self.down:
+            raise ConnectionError(f"{self.name} is down")
+        return [SimpleNamespace(identifier=model_id) for model_id in self.model_ids]
+
+
+def test_pool_spreads_requests():
+    backends = [FakeBackend(f"b{i}", delay=0.02) for i in range(3)]
+    pool = LlamaStackPool(backends)
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(
+            executor.map(lambda _i: pool.inference.completion(model_id="foo"), range(6))
+        )
+
+    assert sorted(results) == ["b0", "b0", "b1", "b1", "b2", "b2"]
+    assert all(backend.counts["max_in_flight"] == 2 for backend in backends)
+
+
+def test_pool_takes_turns_when_idle():
+    backends = [FakeBackend("b0"), FakeBackend("b1")]
+    pool = LlamaStackPool(backends)
+    results = [pool.inference.completion(model_id="foo") for _ in range(4)]
+    assert sorted(results) == ["b0", "b0", "b1", "b1"]
+
+
+def test_pool_routes_by_model():
+    shared, dedicated = FakeBackend("shared"), FakeBackend("dedicated")
+    pool = LlamaStackPool([shared], model_clients={"big": [dedicated]})
+    assert pool.inference.completion(model_id="big") == "dedicated"
+    assert pool.inference.completion(model_id="small") == "shared"
+    assert pool.clients == [shared, dedicated]
+
+
+def test_pool_ejects_failing_members():
+    good, bad = FakeBackend("good"), FakeBackend("bad")
+    bad.down = True
+    pool = LlamaStackPool([good, bad], max_failures=2, ejection_time=60)
+    for _ in range(6):
+        try:
+            pool.inference.completion(model_id="foo")
+        except ConnectionError:
+            pass
+    assert bad.counts["calls"] == 2
+
+    # a health check puts it back once it recovers
+    assert pool.check_health() == [True, False]
+    bad.down = False
+    assert pool.check_health() == [True, True]
+    results = {pool.inference.completion(model_id="foo") for _ in range(2)}
+    assert results == {"good", "bad"}
+
+
+def test_pool_stream_stays_in_flight():
+    backends = [FakeBackend("b0"), FakeBackend("b1")]
+    pool = LlamaStackPool(backends)
+    stream = pool.inference.completion(model_id="foo", stream=True)
+    first = next(stream)
+    # the open stream counts against its member
+    assert pool.inference.completion(model_id="foo") != first
+    assert not list(stream)
+
+
+def test_pool_models_list():
+    pool = LlamaStackPool(
+        [FakeBackend("b0", models=("foo",)), FakeBackend("b1", models=("foo", "bar"))]
+    )
+    assert [model.identifier for model in pool.models.list()] == ["foo", "bar"]
+
+
+def test_pool_models_list_skips_failed_members():
+    good, bad = (
+        FakeBackend("good", models=("foo",)),
+        FakeBackend("bad", models=("bar",)),
+    )
+    bad.down = True
+    pool = LlamaStackPool([good, bad], max_failures=2, ejection_time=60)
+    # the models of the members that answer are still listed
+    assert [model.identifier for model in pool.models.list()] == ["foo"]
+    assert [model.identifier for model in pool.models.list()] == ["foo"]
+    # and the failures count towards ejecting the member
+    assert pool._members.available() == [pool._members.all[0]]
+
+    good.down = True
+    with pytest.raises(ConnectionError):
+        pool.models.list()
+
+
+def test_async_pool_models_list_skips_failed_members():
+    backends = [FakeBackend("good", models=("foo",)), FakeBackend("bad")]
+    backends[1].down = True
+
+    def _async_models(backend):
+        async def _list_models():
+            return backend.list_models()
+
+        return SimpleNamespace(models=SimpleNamespace(list=_list_models))
+
+    pool = AsyncLlamaStackPool([_async_models(backend) for backend in backends])
+    models = asyncio.run(pool.models.list())
+    assert [model.identifier for model in models] == ["foo"]
+
+    backends[0].down = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(pool.models.list())
+
+
+def test_pool_needs_clients():
+    with pytest.raises(ValueError):
+        LlamaStackPool([])
+
+
+def test_prefix_affinity_key():
+    affinity = PrefixAffinity(messages=2, prefix_chars=4)
+    system = {"role": "system", "content": "be brief"}
+    turn1 = [system, {"role": "user", "content": "hi"}]
+    turn2 = turn1 + [
+        {"role": "assistant", "content": "hello"},
+        {"role": "user", "content": "bye"},
+    ]
+    other = [system, {"role": "user", "content": "yo"}]
+    assert affinity.key({"messages": turn1}) == affinity.key({"messages": turn2})
+    assert affinity.key({"messages": turn1}) != affinity.key({"messages": other})
+    assert affinity.key({"messages_batch": [turn2]}) == affinity.key(
+        {"messages": turn1}
+    )
+    assert affinity.key({"content": "abcdef"}) == affinity.key({"content": "abcdxyz"})
+    assert affinity.key({"content_batch": ["abcd"]}) == affinity.key(
+        {"content": "abcd"}
+    )
+    assert affinity.key({}) is None
+
+    with pytest.raises(ValueError):
+        PrefixAffinity(load_factor=0.5)
+
+
+def test_pool_prefix_affinity():
+    backends = [FakeBackend(f"b{i}") for i in range(4)]
+    pool = LlamaStackPool(backends, prefix_affinity=True)
+    prompts = [f"prompt {i} " + "x" * 100 for i in range(20)]
+    first = [pool.inference.completion(model_id="foo", content=p) for p in prompts]
+    again = [pool.inference.completion(model_id="foo", content=p) for p in prompts]
+    assert first == again
+    # different prefixes still spread over the members
+    assert len(set(first)) > 1
+
+
+def test_pool_prefix_affinity_spills_over():
+    backends = [FakeBackend(f"b{i}", delay=0.02) for i in range(2)]
+    pool = LlamaStackPool(backends, prefix_affinity=PrefixAffinity(load_factor=1))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(
+                lambda _i: pool.inference.completion(model_id="foo", content="same"),
+                range(4),
+            )
+        )
+    # the hot member passes on requests instead of taking all four
+    assert sorted(results) == ["b0", "b0", "b1", "b1"]
+
+
+def test_async_pool():
+    class AsyncBackend:
+        def __init__(self, name):
+            self.name = name
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.inference = SimpleNamespace(completion=self.completion)
+
+        async def completion(self, **_kwargs):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return self.name
+
+    backends = [AsyncBackend("b0"), AsyncBackend("b1")]
+    pool = AsyncLlamaStackPool(backends)
+
+    async def _run():
+        return await asyncio.gather(
+            *[pool.inference.completion(model_id="foo") for _ in range(4)]
+        )
+
+    assert sorted(asyncio.run(_run())) == ["b0", "b0", "b1", "b1"]
+    assert all(backend.max_in_flight == 2 for backend in backends)
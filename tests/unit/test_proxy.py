@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# pylint: disable=redefined-outer-name
+
+# Third Party
+import pytest
+
+pytest.importorskip("starlette")
+
+# pylint: disable=wrong-import-position
+# Third Party
+from starlette.testclient import TestClient  # noqa: E402
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.async_client_adapter import (  # noqa: E402
+    AsyncOpenAIClientAdapter,
+)
+from lls_openai_client.proxy import create_app  # noqa: E402
+from tests.unit.test_async_client_adapter import (  # noqa: E402
+    make_fake_async_lls_client,
+)
+
+
+@pytest.fixture
+def lls_client():
+    return make_fake_async_lls_client()
+
+
+@pytest.fixture
+def http(lls_client):
+    client = AsyncOpenAIClientAdapter(lls_client, validate_models=True)
+    with TestClient(create_app(client)) as http:
+        yield http
+
+
+def test_proxy_completions(http):
+    response = http.post("/v1/completions", json={"model": "foo", "prompt": ["a", "b"]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["object"] == "text_completion"
+    assert [choice["text"] for choice in body["choices"]] == ["echo: a", "echo: b"]
+
+
+def test_proxy_completions_stream(http):
+    response = http.post(
+        "/v1/completions", json={"model": "foo", "prompt": "a", "stream": True}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line for line in response.text.split("\n\n") if line]
+    assert events[-1] == "data: [DONE]"
+    assert all(event.startswith("data: {") for event in events[:-1])
+
+
+def test_proxy_chat_completions(http):
+    response = http.post(
+        "/v1/chat/completions",
+        json={"model": "foo", "messages": [{"role": "user", "content": "hi"}]},
+    )
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"] == "hello"
+
+
+def test_proxy_guided_choice(http, lls_client):
+    http.post(
+        "/v1/completions",
+        json={"model": "foo", "prompt": "a", "guided_choice": ["yes", "no"]},
+    )
+    response_format = lls_client.inference.calls[0]["response_format"]
+    assert response_format["json_schema"]["pattern"] == "^(yes|no)$"
+
+
+def test_proxy_models(http):
+    response = http.get("/v1/models")
+    assert response.status_code == 200
+    assert [model["id"] for model in response.json()["data"]] == ["foo"]
+    assert http.get("/v1/models/foo").json()["id"] == "foo"
+
+
+def test_proxy_invalid_request(http):
+    response = http.post("/v1/completions", json={"model": "unknown", "prompt": "a"})
+    assert response.status_code == 400
+    assert response.json()["error"]["type"] == "invalid_request_error"
+
+
+def test_proxy_malformed_request(http):
+    response = http.post(
+        "/v1/completions",
+        content=b"{not json",
+        headers={"content-type": "application/json"},
+    )
+    assert response.status_code == 400
+    response = http.post("/v1/completions", json=["a"])
+    assert response.status_code == 400
+    assert response.json()["error"]["type"] == "invalid_request_error"
+
+
+def test_proxy_output_error(lls_client):
+    client = AsyncOpenAIClientAdapter(lls_client, guided_choice_retries=0)
+    with TestClient(create_app(client)) as http:
+        response = http.post(
+            "/v1/completions",
+            json={"model": "foo", "prompt": "a", "guided_choice": ["yes", "no"]},
+        )
+    # the model's output not being one of the choices is no fault of the
+    # request
+    assert response.status_code == 502
+    assert response.json()["error"]["type"] == "api_error"
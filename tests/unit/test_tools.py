@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# pylint: disable=protected-access
+
+# Standard
+from unittest.mock import patch
+import time
+
+# Third Party
+import pytest
+
+# First Party
+# pylint: disable=import-error
+from lls_openai_client.tools import ToolRegistry, _convert_tools
+
+
+def make_tools(name):
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": f"The {name} tool",
+                "parameters": {
+                    "type": "object",
+                    "properties": {"city": {"type": "string", "description": "A city"}},
+                },
+            },
+        }
+    ]
+
+
+def test_convert():
+    lls_tools = ToolRegistry().convert(make_tools("weather"))
+    assert lls_tools == [
+        {
+            "tool_name": "weather",
+            "description": "The weather tool",
+            "parameters": {
+                "city": {"param_type": "string", "description": "A city"},
+            },
+        }
+    ]
+
+
+def test_convert_is_memoized():
+    registry = ToolRegistry()
+    weather = make_tools("weather")
+    with patch(
+        "lls_openai_client.tools._convert_tools", wraps=lambda tools: []
+    ) as convert:
+        registry.convert(weather)
+        # a new list of the same tools still hits
+        registry.convert(list(weather))
+        # equal tools that aren't the same objects don't
+        registry.convert(make_tools("weather"))
+        registry.convert(make_tools("news"))
+    assert convert.call_count == 3
+    assert len(registry) == 3
+
+
+def test_convert_hit_is_cheaper_than_converting():
+    registry = ToolRegistry()
+    tools = [make_tools(f"tool{i}")[0] for i in range(40)]
+    registry.convert(tools)
+    start = time.perf_counter()
+    for _ in range(100):
+        registry.convert(tools)
+    hits = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(100):
+        _convert_tools(tools)
+    conversions = time.perf_counter() - start
+    assert hits < conversions
+
+
+def test_convert_evicts_least_recently_used():
+    registry = ToolRegistry(max_entries=2)
+    a, b, c = make_tools("a"), make_tools("b"), make_tools("c")
+    registry.convert(a)
+    registry.convert(b)
+    registry.convert(a)
+    registry.convert(c)
+    with patch(
+        "lls_openai_client.tools._convert_tools", wraps=lambda tools: []
+    ) as convert:
+        registry.convert(a)
+        registry.convert(b)
+    assert convert.call_count == 1
+
+
+def test_convert_returns_copies():
+    registry = ToolRegistry()
+    weather = make_tools("weather")
+    registry.convert(weather).clear()
+    assert len(registry.convert(weather)) == 1
+
+
+def test_convert_without_memoization():
+    registry = ToolRegistry(max_entries=0)
+    assert len(registry.convert(make_tools("weather"))) == 1
+    assert len(registry) == 0
+
+
+def test_register():
+    registry = ToolRegistry(max_entries=0)
+    handle = registry.register(make_tools("weather"))
+    assert registry.convert(handle) == ToolRegistry().convert(make_tools("weather"))
+    assert registry.register(make_tools("weather")) == handle
+
+    registry.unregister(handle)
+    with pytest.raises(ValueError):
+        registry.convert(handle)